@@ -0,0 +1,310 @@
+"""Конвеєр статичних файлів фронтенду.
+
+Під час збірки (``python -m app.core.assets``) або на старті сервера:
+  * кожен файл отримує відбиток вмісту в імені (``libs/db.3f2a9c1b04de.js``);
+  * стискається заздалегідь у ``.gz`` (та ``.br``, якщо встановлено brotli);
+  * посилання в HTML-сторінках переписуються на версії з відбитком;
+  * у ``sw.js`` автоматично підставляється список precache та версія кешу.
+
+Файли з відбитком віддаються з ``immutable``-кешуванням, сторінки — з ETag
+та обов'язковою ревалідацією.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from typing import Dict, List, Optional
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+try:
+    import brotli
+except ImportError:  # br необов'язковий — тоді лише gzip
+    brotli = None
+
+ASSETS_URL_PREFIX = "/assets"
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+# Ці файли браузер шукає за фіксованою адресою — їх не перейменовуємо
+STABLE_FILES = ("sw.js", "manifest.json")
+COMPRESSIBLE_EXTENSIONS = (".js", ".css", ".html", ".json", ".svg", ".txt", ".map")
+MIN_COMPRESS_SIZE = 512
+# Скільки останніх збірок тримати на диску: сторінки попередньої версії, ще відкриті
+# у браузерах або віддані не перезапущеним воркером, мають знаходити свої /assets/*
+KEEP_GENERATIONS = 3
+
+_REF_RE = re.compile(r'''(\b(?:src|href)=)(["'])(/?[^"'#?:]+)\2''')
+_CACHE_NAME_RE = re.compile(r"const CACHE_NAME = '[^']*';")
+_PRECACHE_RE = re.compile(r"const ASSETS_TO_CACHE = \[(.*?)\];", re.S)
+
+
+def _digest(data: bytes, length: int = 12) -> str:
+    return hashlib.sha256(data).hexdigest()[:length]
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _inside(root: str, rel: str) -> Optional[str]:
+    """Реальний шлях ``rel`` у ``root`` або ``None``, якщо він виходить за межі.
+
+    Starlette декодує ``%5C``, тож на Windows ``..\\`` у шляху URL — теж вихід угору.
+    """
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, rel))
+    try:
+        if os.path.commonpath([path, root]) != root:
+            return None
+    except ValueError:  # Windows: інший диск
+        return None
+    return path
+
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() != coding:
+            continue
+        q = params.strip()
+        return not (q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"))
+    return False
+
+
+class AssetPipeline:
+    def __init__(self, source_dir: str, build_dir: str):
+        self.source_dir = source_dir
+        self.build_dir = build_dir
+        self.assets: Dict[str, dict] = {}  # "/libs/db.js" -> {"url", "path", "etag"}
+        self.pages: Dict[str, dict] = {}   # "report.html" -> {"path", "etag"}
+        self.stable: Dict[str, dict] = {}  # "sw.js" -> {"path", "etag"}
+        self.precache: List[str] = []
+        self._page_refs: Dict[str, List[str]] = {}  # "report.html" -> ["/libs/db.js", ...]
+
+    # --- ЗБІРКА ---
+
+    def build(self):
+        assets, pages, stable = {}, {}, {}
+
+        for root, dirs, files in os.walk(self.source_dir):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for filename in files:
+                if filename.startswith("."):
+                    continue
+                src_path = os.path.join(root, filename)
+                rel = os.path.relpath(src_path, self.source_dir).replace(os.sep, "/")
+                if rel.endswith(".html") or rel in STABLE_FILES:
+                    continue
+                with open(src_path, "rb") as f:
+                    data = f.read()
+                etag = _digest(data)
+                stem, ext = os.path.splitext(rel)
+                hashed_rel = f"{stem}.{etag}{ext}"
+                out_path = os.path.join(self.build_dir, "assets", *hashed_rel.split("/"))
+                self._emit(out_path, data)
+                assets["/" + rel] = {"url": f"{ASSETS_URL_PREFIX}/{hashed_rel}", "path": out_path, "etag": etag}
+
+        self.assets = assets
+
+        for filename in sorted(os.listdir(self.source_dir)):
+            if not filename.endswith(".html"):
+                continue
+            with open(os.path.join(self.source_dir, filename), "r", encoding="utf-8") as f:
+                html = f.read()
+            data = self._rewrite_refs(html, filename).encode("utf-8")
+            etag = _digest(data, 16)
+            out_path = os.path.join(self.build_dir, "pages", f"{etag}-{filename}")
+            self._emit(out_path, data)
+            pages[filename] = {"path": out_path, "etag": etag}
+
+        self.pages = pages
+
+        manifest_src = os.path.join(self.source_dir, "manifest.json")
+        if os.path.exists(manifest_src):
+            with open(manifest_src, "rb") as f:
+                data = f.read()
+            out_path = os.path.join(self.build_dir, "stable", "manifest.json")
+            self._emit(out_path, data, overwrite=True)
+            stable["manifest.json"] = {"path": out_path, "etag": _digest(data, 16)}
+
+        sw_src = os.path.join(self.source_dir, "sw.js")
+        if os.path.exists(sw_src):
+            with open(sw_src, "r", encoding="utf-8") as f:
+                data = self._render_service_worker(f.read(), stable).encode("utf-8")
+            out_path = os.path.join(self.build_dir, "stable", "sw.js")
+            self._emit(out_path, data, overwrite=True)
+            stable["sw.js"] = {"path": out_path, "etag": _digest(data, 16)}
+
+        self.stable = stable
+        self._prune([a["path"] for a in assets.values()] + [p["path"] for p in pages.values()])
+        _write_atomic(
+            os.path.join(self.build_dir, "asset-manifest.json"),
+            json.dumps({k: v["url"] for k, v in assets.items()}, ensure_ascii=False, indent=2).encode("utf-8")
+        )
+        print(f"Статика зібрана: файлів {len(assets)}, сторінок {len(pages)}, precache {len(self.precache)}")
+
+    def _emit(self, out_path: str, data: bytes, overwrite: bool = False):
+        """Записує файл і його стиснуті варіанти (ім'я з відбитком — тож готові файли не перезбираємо)."""
+        if overwrite or not os.path.exists(out_path):
+            _write_atomic(out_path, data)
+        compressible = out_path.endswith(COMPRESSIBLE_EXTENSIONS) and len(data) >= MIN_COMPRESS_SIZE
+        for suffix, compress in ((".gz", self._gzip), (".br", self._brotli)):
+            variant_path = out_path + suffix
+            if not compressible or (compress is self._brotli and brotli is None):
+                if overwrite and os.path.exists(variant_path):
+                    os.remove(variant_path)
+                continue
+            if overwrite or not os.path.exists(variant_path):
+                packed = compress(data)
+                # Варіант, який не менший за оригінал, лише марнує CPU клієнта
+                if len(packed) < len(data):
+                    _write_atomic(variant_path, packed)
+                elif os.path.exists(variant_path):
+                    os.remove(variant_path)
+
+    def _prune(self, keep: List[str]):
+        """Прибирає файли збірок, старших за ``KEEP_GENERATIONS`` останніх."""
+        generations_path = os.path.join(self.build_dir, "generations.json")
+        try:
+            with open(generations_path, "r", encoding="utf-8") as f:
+                generations = json.load(f)
+        except (OSError, ValueError):
+            generations = []
+        current = sorted(os.path.relpath(p, self.build_dir) for p in keep)
+        if not generations or generations[-1] != current:
+            generations.append(current)
+        generations = generations[-KEEP_GENERATIONS:]
+        _write_atomic(generations_path, json.dumps(generations, ensure_ascii=False).encode("utf-8"))
+
+        keep_set = set()
+        for generation in generations:
+            for rel in generation:
+                path = os.path.join(self.build_dir, rel)
+                keep_set.update((path, path + ".gz", path + ".br"))
+        for sub in ("assets", "pages"):
+            for root, _, files in os.walk(os.path.join(self.build_dir, sub)):
+                for filename in files:
+                    path = os.path.join(root, filename)
+                    if path not in keep_set and not filename.endswith(".tmp"):
+                        os.remove(path)
+
+    @staticmethod
+    def _gzip(data: bytes) -> bytes:
+        return gzip.compress(data, compresslevel=9, mtime=0)
+
+    @staticmethod
+    def _brotli(data: bytes) -> bytes:
+        return brotli.compress(data, quality=11)
+
+    def _rewrite_refs(self, html: str, page: str) -> str:
+        refs = self._page_refs[page] = []
+
+        def repl(m):
+            logical = "/" + m.group(3).lstrip("/")
+            asset = self.assets.get(logical)
+            if not asset:
+                return m.group(0)
+            refs.append(logical)
+            return f"{m.group(1)}{m.group(2)}{asset['url']}{m.group(2)}"
+        return _REF_RE.sub(repl, html)
+
+    def _render_service_worker(self, source: str, stable: dict) -> str:
+        listed = []
+        m = _PRECACHE_RE.search(source)
+        if m:
+            listed = re.findall(r"'([^']+)'", m.group(1))
+        external = [u for u in listed if u.startswith("http")]
+
+        # Сторінки застосунку — ті, що перелічені у вихідному sw.js; чернетки й копії
+        # (xxx.html, «index – копія.html») лежать у каталозі, але в офлайн-кеш не йдуть
+        app_pages = [name for name in self.pages if f"/{name}" in listed]
+        logical_assets = [u for u in listed if u in self.assets]
+        for name in app_pages:
+            logical_assets += self._page_refs.get(name, [])
+
+        local = ["/"] + [f"/{name}" for name in app_pages]
+        local += [self.assets[u]["url"] for u in dict.fromkeys(logical_assets)]
+        # Маніфест PWA посилається на іконку за старою адресою
+        if "/icon.png" in self.assets:
+            local.append("/icon.png")
+        local += [f"/{name}" for name in stable]
+        self.precache = local + external
+
+        version = _digest("\n".join(
+            [f"{p}:{v['etag']}" for p, v in self.pages.items()]
+            + [a["url"] for a in self.assets.values()]
+            + [f"{n}:{v['etag']}" for n, v in stable.items()]
+        ).encode("utf-8"))
+        source = _CACHE_NAME_RE.sub(f"const CACHE_NAME = 'uav-v8-cache-{version}';", source, count=1)
+        entries = ",\n".join(f"    {json.dumps(u, ensure_ascii=False)}" for u in self.precache)
+        return _PRECACHE_RE.sub(lambda _: f"const ASSETS_TO_CACHE = [\n{entries}\n];", source, count=1)
+
+    # --- ВІДДАЧА ---
+
+    def asset_url(self, logical_path: str) -> str:
+        asset = self.assets.get("/" + logical_path.lstrip("/"))
+        return asset["url"] if asset else logical_path
+
+    def asset_response(self, request: Request, hashed_rel: str) -> Optional[Response]:
+        path = _inside(os.path.join(self.build_dir, "assets"), hashed_rel)
+        if path is None or not os.path.isfile(path):
+            return None
+        etag = os.path.splitext(hashed_rel)[0].rsplit(".", 1)[-1]
+        return self._send(request, path, etag, IMMUTABLE_CACHE)
+
+    def has_page(self, name: str) -> bool:
+        """Сторінка є у збірці або (поки збірка йде) у вихідному каталозі."""
+        if name in self.pages:
+            return True
+        if "/" in name or "\\" in name:
+            return False
+        path = _inside(self.source_dir, name)
+        return path is not None and os.path.isfile(path)
+
+    def page_response(self, request: Request, name: str) -> Response:
+        page = self.pages.get(name)
+        if not page:
+            # Збірка не відбулась — віддаємо оригінал без переписаних посилань
+            return FileResponse(os.path.join(self.source_dir, name), headers={"Cache-Control": REVALIDATE_CACHE})
+        return self._send(request, page["path"], page["etag"], REVALIDATE_CACHE, media_type="text/html; charset=utf-8")
+
+    def stable_response(self, request: Request, name: str) -> Response:
+        entry = self.stable.get(name)
+        if not entry:
+            return FileResponse(os.path.join(self.source_dir, name), headers={"Cache-Control": REVALIDATE_CACHE})
+        return self._send(request, entry["path"], entry["etag"], REVALIDATE_CACHE)
+
+    def _send(self, request: Request, path: str, etag: str, cache_control: str, media_type: Optional[str] = None) -> Response:
+        quoted_etag = f'"{etag}"'
+        headers = {"Cache-Control": cache_control, "ETag": quoted_etag, "Vary": "Accept-Encoding"}
+
+        if_none_match = request.headers.get("if-none-match", "")
+        if if_none_match and (if_none_match.strip() == "*" or quoted_etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]):
+            return Response(status_code=304, headers=headers)
+
+        media_type = media_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if media_type.startswith(("text/", "application/javascript")) and "charset" not in media_type:
+            media_type += "; charset=utf-8"
+
+        # Діапазони (Range) віддаємо з нестиснутого файлу — зсуви рахуються від оригіналу
+        if "range" not in request.headers:
+            accept = request.headers.get("accept-encoding", "")
+            for coding, suffix in (("br", ".br"), ("gzip", ".gz")):
+                if _accepts(accept, coding) and os.path.exists(path + suffix):
+                    headers["Content-Encoding"] = coding
+                    return FileResponse(path + suffix, media_type=media_type, headers=headers)
+
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+
+if __name__ == "__main__":
+    base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    AssetPipeline(os.path.join(base_dir, "frontend"), os.path.join(base_dir, "build", "static")).build()
@@ -0,0 +1,178 @@
+"""Канал живих оновлень (Server-Sent Events).
+
+Ендпоінти запису публікують компактні події (``flight_added``,
+``flight_updated``, ``flight_deleted``, ``flights_bulk_*``, ``drone_*``,
+``announcement``),
+а сторінки отримують їх через ``/api/events`` з фільтром за підрозділом.
+
+Ідентифікатор події — ``<epoch>-<seq>``: після перезапуску сервера epoch
+інший, тож клієнт із застарілим ``Last-Event-ID`` отримує ``resync`` і
+перезавантажує дані замість того, щоб мовчки пропустити зміни.
+
+З кількома воркерами брокер пише події у спільний журнал (``SharedState``),
+а ``run_relay`` у кожному воркері читає журнал і роздає своїм підписникам —
+тож epoch/seq однакові незалежно від того, до якого воркера підключився клієнт.
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, List, Optional, Set, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.shared_state import SharedState
+from app.core.streaming import dumps
+
+HISTORY_SIZE = 1000
+SUBSCRIBER_QUEUE_SIZE = 256
+HEARTBEAT_SECONDS = 15
+RETRY_MS = 3000
+
+
+def _normalize_unit(unit: Optional[str]) -> Optional[str]:
+    # Назви підрозділів у рядках бази бувають з пробілами по краях
+    return (unit.strip() or None) if unit else None
+
+
+class Subscription:
+    def __init__(self, unit: Optional[str]):
+        self.unit = _normalize_unit(unit)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def wants(self, unit: Optional[str]) -> bool:
+        unit = _normalize_unit(unit)
+        return self.unit is None or unit is None or unit == self.unit
+
+
+class EventBroker:
+    def __init__(self, history_size: int = HISTORY_SIZE, log: Optional[SharedState] = None):
+        self.log = log
+        if log is not None:
+            self.epoch = log.log_id()
+            self._seq = log.last_event_seq()
+        else:
+            self.epoch = format(int(time.time() * 1000), "x")
+            self._seq = 0
+        self._history: Deque[Tuple[int, Optional[str], bytes]] = deque(maxlen=history_size)
+        self._subscribers: Set[Subscription] = set()
+        self._listeners: List[Callable[[dict], None]] = []
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def add_listener(self, callback: Callable[[dict], None]):
+        """Внутрішній споживач подій цього воркера (напр. пошуковий індекс); викликається в циклі подій."""
+        self._listeners.append(callback)
+
+    async def publish(self, event_type: str, data: dict, unit: Optional[str] = None):
+        """Розсилає подію. ``unit=None`` — подія для всіх підрозділів.
+
+        Зі спільним журналом подія лише дописується в нього (у пулі потоків: запис у
+        SQLite може чекати на блокування інших воркерів), а роздає її ``run_relay``.
+        """
+        unit = _normalize_unit(unit)
+        payload = dumps({"type": event_type, "unit": unit, **data})
+        if self.log is not None:
+            await run_in_threadpool(self.log.append_event, payload)
+            return
+        self._seq += 1
+        self._dispatch(self._seq, unit, payload)
+
+    async def run_relay(self, poll_interval: float = 0.25):
+        """Фонова задача воркера: читає спільний журнал і роздає події локальним підписникам."""
+        while True:
+            try:
+                rows = await run_in_threadpool(self.log.read_events, self._seq, 500, 1000)
+            except Exception as e:
+                print(f"Помилка читання журналу подій: {e}")
+                await asyncio.sleep(5)
+                continue
+            for seq, payload in rows:
+                self._dispatch(seq, json.loads(payload).get("unit"), bytes(payload))
+            if not rows and not self.log.blocking_reads:
+                await asyncio.sleep(poll_interval)
+
+    def _dispatch(self, seq: int, unit: Optional[str], payload: bytes):
+        self._seq = seq
+        if self._listeners:
+            event = json.loads(payload)
+            for callback in self._listeners:
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"Помилка обробника події {event.get('type')}: {e}")
+        frame = b"id: " + f"{self.epoch}-{seq}".encode() + b"\ndata: " + payload + b"\n\n"
+        self._history.append((seq, unit, frame))
+
+        for sub in list(self._subscribers):
+            if not sub.wants(unit):
+                continue
+            try:
+                sub.queue.put_nowait((seq, frame))
+            except asyncio.QueueFull:
+                # Повільний клієнт: не тримаємо для нього пам'ять без меж —
+                # закриваємо потік, а після перепідключення він дочитає з історії
+                sub.overflowed = True
+
+    async def _replay(self, sub: Subscription, last_event_id: Optional[str]) -> Optional[list]:
+        """Пари (seq, кадр) після ``last_event_id`` або ``None``, якщо частина подій уже втрачена."""
+        if not last_event_id:
+            return []
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        last_seq = int(seq)
+        if last_seq > self._seq:
+            return None
+        oldest = self._history[0][0] if self._history else self._seq + 1
+        if last_seq >= oldest - 1:
+            return [(s, frame) for s, unit, frame in self._history if s > last_seq and sub.wants(unit)]
+        if self.log is None:
+            return None
+        # Воркер стартував пізніше, ніж клієнт бачив останню подію — дочитуємо зі спільного журналу
+        rows = await run_in_threadpool(self.log.read_events, last_seq, self._history.maxlen)
+        if not rows or rows[0][0] != last_seq + 1:
+            return None
+        backlog = []
+        for s, payload in rows:
+            if s > self._seq:
+                break
+            if sub.wants(json.loads(payload).get("unit")):
+                backlog.append((s, b"id: " + f"{self.epoch}-{s}".encode() + b"\ndata: " + bytes(payload) + b"\n\n"))
+        return backlog
+
+    async def stream(self, unit: Optional[str], last_event_id: Optional[str], is_disconnected) -> AsyncIterator[bytes]:
+        sub = Subscription(unit)
+        # Підписуємось до читання історії, щоб між ними нічого не загубилось
+        self._subscribers.add(sub)
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode()
+            backlog = await self._replay(sub, last_event_id)
+            if backlog is None:
+                yield self._control_frame("resync")
+                backlog = []
+            replayed_upto = 0
+            for seq, frame in backlog:
+                replayed_upto = seq
+                yield frame
+
+            while not sub.overflowed:
+                try:
+                    seq, frame = await asyncio.wait_for(sub.queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        break
+                    yield b": ping\n\n"
+                    continue
+                if seq <= replayed_upto:
+                    continue
+                yield frame
+        finally:
+            self._subscribers.discard(sub)
+
+    def _control_frame(self, event_type: str) -> bytes:
+        # Без id: керуючі кадри не зсувають позицію відновлення клієнта
+        return b"data: " + dumps({"type": event_type, "unit": None}) + b"\n\n"
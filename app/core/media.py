@@ -0,0 +1,270 @@
+"""Сховище фото до донесень з адресацією за вмістом.
+
+Файл приймається потоком на диск (шматками, з підрахунком sha256 на льоту),
+тож у пам'яті ніколи не лежить більше одного шматка. Ім'я блоба — його sha256:
+те саме фото, надіслане вдруге, не займає місця вдруге.
+
+Зменшені варіанти (ширина для DOCX, для Telegram, мініатюра) генеруються при
+першому запиті й кешуються поруч. Блоби без живих посилань прибирає ``gc``.
+
+Посилання (``refs``) — хто тримає блоб: ``upload`` — щойно завантажене фото, що
+чекає на донесення; ``report:...`` — донесення (DOCX, Telegram), у яке воно пішло.
+
+Розмітка каталогу::
+
+    blobs/ab/abcdef...            оригінал
+    variants/ab/abcdef....thumb.jpg
+    tmp/                          незавершені завантаження
+    media.sqlite3                 метадані та посилання
+"""
+import hashlib
+import os
+import re
+import tempfile
+import time
+from typing import BinaryIO, Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # без Pillow варіанти не зменшуються — віддається оригінал
+    Image = None
+
+from app.core.sqlite_db import SQLiteDB
+
+CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+UPLOAD_HOLD_TTL = 7 * 24 * 3600  # чернетки з фото можуть чекати зв'язку кілька днів
+REPORT_HOLD_TTL = 90 * 24 * 3600  # фото з донесення — для повторного формування DOCX
+GC_GRACE_SECONDS = 3600
+TMP_MAX_AGE = 3600
+
+# Назва варіанта -> (найбільша сторона в px, якість JPEG)
+VARIANTS = {
+    "docx": (1600, 85),      # 15 см у документі ~ 270 dpi
+    "telegram": (1280, 87),  # Telegram однаково стискає фото до 1280 px
+    "thumb": (320, 75),
+}
+
+_SHA_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# Сигнатури форматів, які приймаємо як фото
+_MAGIC = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+class MediaError(ValueError):
+    pass
+
+
+class MediaTooLarge(MediaError):
+    pass
+
+
+def sniff_mime(head: bytes) -> Optional[str]:
+    for magic, mime in _MAGIC:
+        if head.startswith(magic):
+            return mime
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:12] in (b"ftypheic", b"ftypheix", b"ftypmif1"):
+        return "image/heic"
+    return None
+
+
+def is_media_id(value: str) -> bool:
+    return bool(value) and bool(_SHA_RE.match(value))
+
+
+class MediaStore:
+    def __init__(self, root: str):
+        self.root = root
+        self.blobs_dir = os.path.join(root, "blobs")
+        self.variants_dir = os.path.join(root, "variants")
+        self.tmp_dir = os.path.join(root, "tmp")
+        for d in (self.blobs_dir, self.variants_dir, self.tmp_dir):
+            os.makedirs(d, exist_ok=True)
+        self._db = SQLiteDB(os.path.join(root, "media.sqlite3"))
+        db = self._db.conn()
+        db.execute("CREATE TABLE IF NOT EXISTS blobs (sha TEXT PRIMARY KEY, size INTEGER, mime TEXT, created_at REAL)")
+        db.execute("CREATE TABLE IF NOT EXISTS refs (sha TEXT NOT NULL, ref TEXT NOT NULL, expires_at REAL, PRIMARY KEY (sha, ref))")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_refs_ref ON refs (ref)")
+
+    # --- ШЛЯХИ ---
+
+    def blob_path(self, sha: str) -> str:
+        if not is_media_id(sha):
+            raise MediaError("Invalid media id")
+        return os.path.join(self.blobs_dir, sha[:2], sha)
+
+    def _variant_file(self, sha: str, variant: str) -> str:
+        return os.path.join(self.variants_dir, sha[:2], f"{sha}.{variant}.jpg")
+
+    def exists(self, sha: str) -> bool:
+        return is_media_id(sha) and os.path.exists(self.blob_path(sha))
+
+    def info(self, sha: str) -> Optional[dict]:
+        if not is_media_id(sha):
+            return None
+        row = self._db.conn().execute("SELECT size, mime FROM blobs WHERE sha = ?", (sha,)).fetchone()
+        if row is None or not os.path.exists(self.blob_path(sha)):
+            return None
+        return {"id": sha, "size": row[0], "mime": row[1]}
+
+    # --- ЗАПИС ---
+
+    def put_stream(self, stream: BinaryIO, max_bytes: int = MAX_UPLOAD_BYTES) -> dict:
+        """Пише потік у tmp шматками, рахуючи sha256; дублікат просто відкидається."""
+        digest = hashlib.sha256()
+        size = 0
+        head = b""
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if len(head) < 16:
+                        head += chunk[:16]
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise MediaTooLarge(f"File is larger than {max_bytes // (1024 * 1024)} MB")
+                    digest.update(chunk)
+                    out.write(chunk)
+            mime = sniff_mime(head)
+            if mime is None:
+                raise MediaError("Unsupported image format")
+
+            sha = digest.hexdigest()
+            # Посилання — до перевірки наявності: gc не прибере блоб, який ми щойно «знайшли»
+            self.hold(sha, "upload", ttl=UPLOAD_HOLD_TTL)
+            path = self.blob_path(sha)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._db.conn().execute("INSERT OR IGNORE INTO blobs (sha, size, mime, created_at) VALUES (?, ?, ?, ?)", (sha, size, mime, time.time()))
+        return {"id": sha, "size": size, "mime": mime}
+
+    def put_bytes(self, data: bytes, max_bytes: int = MAX_UPLOAD_BYTES) -> dict:
+        from io import BytesIO
+        return self.put_stream(BytesIO(data), max_bytes)
+
+    # --- ПОСИЛАННЯ ---
+
+    def hold(self, sha: str, ref: str, ttl: Optional[float] = None):
+        """Посилання на блоб; з ``ttl`` — тимчасове (повторний виклик подовжує)."""
+        expires_at = time.time() + ttl if ttl else None
+        self._db.conn().execute("INSERT OR REPLACE INTO refs (sha, ref, expires_at) VALUES (?, ?, ?)", (sha, ref, expires_at))
+
+    def release(self, ref: str, sha: Optional[str] = None):
+        if sha is None:
+            self._db.conn().execute("DELETE FROM refs WHERE ref = ?", (ref,))
+        else:
+            self._db.conn().execute("DELETE FROM refs WHERE ref = ? AND sha = ?", (ref, sha))
+
+    def attach(self, sha: str, report_ref: str, ttl: float = REPORT_HOLD_TTL):
+        """Фото використане в донесенні: посилання донесення замінює тимчасове ``upload``."""
+        # Спершу нове посилання, потім зняття старого — між ними gc блоб не побачить «сиротою»
+        self.hold(sha, report_ref, ttl=ttl)
+        self.release("upload", sha)
+
+    # --- ВАРІАНТИ ---
+
+    def variant_path(self, sha: str, variant: str) -> str:
+        """Шлях до зменшеної копії; генерується при першому запиті.
+
+        Якщо Pillow немає або фото не розпізнається — повертається оригінал.
+        """
+        if variant not in VARIANTS:
+            raise MediaError(f"Unknown variant: {variant}")
+        src = self.blob_path(sha)
+        if not os.path.exists(src):
+            raise FileNotFoundError(sha)
+        path = self._variant_file(sha, variant)
+        if os.path.exists(path):
+            return path
+        if Image is None:
+            return src
+
+        max_side, quality = VARIANTS[variant]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Два паралельні запити пишуть кожен свій tmp, os.replace атомарний — перемагає будь-який
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix=".jpg")
+        os.close(fd)
+        try:
+            with Image.open(src) as img:
+                img = ImageOps.exif_transpose(img)
+                if img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+                img.thumbnail((max_side, max_side))
+                img.save(tmp_path, "JPEG", quality=quality, optimize=True, progressive=True)
+            os.replace(tmp_path, path)
+            return path
+        except Exception as e:
+            print(f"Помилка генерації варіанта {variant} для {sha[:12]}: {e}")
+            return src
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # --- ПРИБИРАННЯ ---
+
+    def gc(self, grace: float = GC_GRACE_SECONDS) -> dict:
+        """Видаляє блоби без живих посилань (старші за ``grace``) разом з їх варіантами."""
+        now = time.time()
+        db = self._db.conn()
+        db.execute("DELETE FROM refs WHERE expires_at IS NOT NULL AND expires_at < ?", (now,))
+        orphans = [r[0] for r in db.execute(
+            "SELECT sha FROM blobs WHERE created_at < ? AND sha NOT IN (SELECT sha FROM refs)", (now - grace,)
+        )]
+        known = {r[0] for r in db.execute("SELECT sha FROM blobs")}
+
+        removed_bytes = 0
+        removed = 0
+        for sha in orphans:
+            # Повторна перевірка посилань в одному запиті з видаленням — блоб могли щойно завантажити знову
+            cur = db.execute("DELETE FROM blobs WHERE sha = ? AND sha NOT IN (SELECT sha FROM refs)", (sha,))
+            if cur.rowcount:
+                removed_bytes += self._remove_files(sha)
+                removed += 1
+
+        # Файли, що лишились після збою між записом на диск і в базу
+        strays = 0
+        for dirpath, _, files in os.walk(self.blobs_dir):
+            for name in files:
+                path = os.path.join(dirpath, name)
+                if name not in known and now - os.path.getmtime(path) > grace:
+                    removed_bytes += self._remove_files(name) if is_media_id(name) else _unlink(path)
+                    strays += 1
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            if now - os.path.getmtime(path) > TMP_MAX_AGE:
+                removed_bytes += _unlink(path)
+
+        return {"removed_blobs": removed, "removed_strays": strays, "freed_bytes": removed_bytes}
+
+    def _remove_files(self, sha: str) -> int:
+        freed = _unlink(self.blob_path(sha))
+        for variant in VARIANTS:
+            freed += _unlink(self._variant_file(sha, variant))
+        return freed
+
+
+def _unlink(path: str) -> int:
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
@@ -0,0 +1,86 @@
+"""Групування польотів у місії (зміни) для журналу польотів.
+
+Місія — польоти одного оператора з однаковими ``date`` + ``shift_time``.
+Порядок — новіші першими; сторінки гортаються курсором за ключем місії.
+"""
+import base64
+import json
+from typing import List, Optional, Tuple
+
+from app.core.reports import NO_FLIGHTS_RESULT
+
+MissionKey = Tuple[str, str, str]
+
+DEFAULT_MISSIONS_LIMIT = 20
+MAX_MISSIONS_LIMIT = 200
+EMPTY_ROUTE = "Не вказано"
+
+
+def mission_key(flight: dict) -> MissionKey:
+    return (str(flight.get("date") or ""), str(flight.get("shift_time") or ""), str(flight.get("operator") or ""))
+
+
+def encode_cursor(key: MissionKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key), ensure_ascii=False).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[MissionKey]:
+    """``None`` для порожнього курсора; ``ValueError`` — для зіпсованого."""
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list) or len(key) != 3:
+        raise ValueError("Invalid cursor")
+    return tuple(str(k) for k in key)
+
+
+def _to_number(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def build_missions(flights: List[dict], before: Optional[MissionKey] = None, limit: int = DEFAULT_MISSIONS_LIMIT) -> dict:
+    """Сторінка місій з ``flights``: ключі строго «старші» за ``before``, не більше ``limit``."""
+    grouped = {}
+    for f in flights:
+        key = mission_key(f)
+        if before is not None and key >= before:
+            continue
+        grouped.setdefault(key, []).append(f)
+
+    keys = sorted(grouped, reverse=True)
+    page_keys = keys[:limit]
+
+    missions = []
+    for key in page_keys:
+        mission_flights = sorted(grouped[key], key=lambda f: (str(f.get("takeoff") or ""), f.get("id") or 0))
+        active = [f for f in mission_flights if f.get("result") != NO_FLIGHTS_RESULT]
+        routes = []
+        for f in mission_flights:
+            route = f.get("route")
+            if route and route != EMPTY_ROUTE and route not in routes:
+                routes.append(route)
+        first = mission_flights[0]
+        missions.append({
+            "key": encode_cursor(key),
+            "date": first.get("date"),
+            "shift_time": first.get("shift_time"),
+            "unit": first.get("unit"),
+            "operator": first.get("operator"),
+            "drone": first.get("drone"),
+            "routes": routes,
+            "flights_count": len(active),
+            "total_duration": sum(_to_number(f.get("duration")) for f in active),
+            "total_distance": sum(_to_number(f.get("distance")) for f in active),
+            "flights": mission_flights,
+        })
+
+    return {
+        "missions": missions,
+        "next_cursor": encode_cursor(page_keys[-1]) if len(keys) > limit else None,
+    }
@@ -0,0 +1,56 @@
+"""Збирання добового донесення з польотів підрозділу.
+
+Одна структура живить і текстовий попередній перегляд у ``report.html``,
+і таблицю в DOCX — тож вони завжди збігаються.
+"""
+from typing import List
+
+NO_FLIGHTS_RESULT = "Польоти не здійснювались"
+
+
+def fmt_time(t) -> str:
+    """"05:54:00" -> "05:54"."""
+    return str(t)[:5] if t else "--"
+
+
+def flight_time_line(flight: dict) -> str:
+    return f"{fmt_time(flight.get('takeoff'))} - {fmt_time(flight.get('landing'))} ({flight.get('distance') or 0} м)"
+
+
+def assemble_daily_report(flights: List[dict], unit: str, date: str) -> dict:
+    """Групує польоти дня: оператор -> БпАК -> час вильотів.
+
+    ``table`` — ті самі дані рядками «оператор + БпАК» для таблиці DOCX.
+    """
+    active = [f for f in flights if f.get("result") != NO_FLIGHTS_RESULT]
+    active.sort(key=lambda f: (str(f.get("takeoff") or ""), f.get("id") or 0))
+
+    operators = {}
+    drones_list = []
+    for f in active:
+        op = f.get("operator") or "Невідомий"
+        dr = f.get("drone") or "БпЛА"
+        if dr not in drones_list:
+            drones_list.append(dr)
+        entry = operators.setdefault(op, {"operator": op, "count": 0, "drones": {}})
+        entry["count"] += 1
+        entry["drones"].setdefault(dr, []).append(flight_time_line(f))
+
+    operators_out = [
+        {"operator": e["operator"], "count": e["count"],
+         "drones": [{"drone": dr, "times": times} for dr, times in e["drones"].items()]}
+        for e in operators.values()
+    ]
+    table = [
+        {"operator": op["operator"], "drone": d["drone"], "count": len(d["times"]), "details": "; ".join(d["times"])}
+        for op in operators_out for d in op["drones"]
+    ]
+    return {
+        "unit": unit,
+        "date": date,
+        "operators": operators_out,
+        "drones_list": drones_list,
+        "table": table,
+        "flights_count": len(active),
+        "operators_count": len(operators_out),
+    }
@@ -0,0 +1,352 @@
+"""Пошук польотів у пам'яті: інвертований індекс + триграми для нечіткого пошуку.
+
+Індексуються ``route``, ``operator``, ``drone``, ``battery_id`` та ``result``.
+Кожне слово запиту має знайтись у польоті (І), а збіг рахується як:
+
+* точний — повна вага поля;
+* префіксний («кодим» -> «кодима») — трохи менше;
+* нечіткий (схожість триграм, одруківки) — ще менше; лише для маршруту,
+  оператора та БпАК: номер АКБ з одруківкою — це вже інша АКБ.
+
+Індекс оновлюється подіями запису (ті самі, що йдуть у SSE), тож у кожному
+воркері він актуальний без повторного завантаження всієї історії. Пошук іде в
+пулі потоків: події з циклу подій лише стають у чергу, а застосовуються до
+індексу під блокуванням у потоці пошуку чи перебудови.
+"""
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import deque
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from starlette.concurrency import run_in_threadpool
+
+# Поле -> (біт у масці, вага в рейтингу)
+FIELDS = {
+    "route": (1, 3.0),
+    "operator": (2, 3.0),
+    "battery_id": (4, 3.0),
+    "drone": (8, 2.0),
+    "result": (16, 1.0),
+}
+PREFIX_FACTOR = 0.7
+FUZZY_FACTOR = 0.6
+FUZZY_MIN_SIMILARITY = 0.4
+FUZZY_MIN_LENGTH = 3
+MAX_EXPANSIONS = 50
+MAX_PREFIX_EXPANSIONS = 500  # короткий префікс номера АКБ («1») розгортається в сотні слів
+FUZZY_FIELDS = ("route", "operator", "drone")
+_ALL_MASK = sum(bit for bit, _ in FIELDS.values())
+_FUZZY_MASK = sum(FIELDS[field][0] for field in FUZZY_FIELDS)
+
+# Вага за маскою полів — найбільша з ваг полів, де знайшлось слово
+_MASK_WEIGHTS = [
+    max([weight for bit, weight in FIELDS.values() if mask & bit], default=0.0)
+    for mask in range(2 ** len(FIELDS))
+]
+
+DEFAULT_SEARCH_LIMIT = 50
+MAX_SEARCH_LIMIT = 500
+
+_TOKEN_RE = re.compile(r"\w+")
+_APOSTROPHES = str.maketrans("", "", "'’ʼ`")
+
+
+def tokenize(text) -> List[str]:
+    if text is None:
+        return []
+    return list(_tokenize_value(str(text)))
+
+
+@lru_cache(maxsize=65536)
+def _tokenize_value(text: str) -> tuple:
+    # Значення полів сильно повторюються (маршрути, прізвища, моделі) — кеш прискорює побудову в рази
+    return tuple(_TOKEN_RE.findall(text.casefold().translate(_APOSTROPHES)))
+
+
+def trigrams(term: str) -> Set[str]:
+    padded = f"${term}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Відстань Дамерау-Левенштейна (з перестановкою сусідніх літер); понад ``limit`` — ``limit + 1``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def _typo_limit(term: str) -> int:
+    return 1 if len(term) < 7 else 2
+
+
+class FlightSearchIndex:
+    def __init__(self):
+        self._flights: Dict[int, dict] = {}
+        self._doc_terms: Dict[int, Dict[str, int]] = {}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._vocab: List[str] = []
+        self._trigrams: Dict[str, Set[str]] = {}  # лише слова з FUZZY_FIELDS
+        self._fuzzy_docs: Dict[str, int] = {}     # слово -> у скількох польотах воно в FUZZY_FIELDS
+        self._by_unit: Dict[str, Set[int]] = {}
+        self._dates: Dict[int, str] = {}
+
+    @classmethod
+    def build(cls, flights: Iterable[dict]) -> "FlightSearchIndex":
+        index = cls()
+        for flight in flights:
+            index.upsert(flight)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    # --- ОНОВЛЕННЯ ---
+
+    def upsert(self, flight: dict):
+        flight_id = flight.get("id")
+        if flight_id is None:
+            return
+        if flight_id in self._flights:
+            self.remove(flight_id)
+
+        terms: Dict[str, int] = {}
+        for field, (bit, _) in FIELDS.items():
+            for term in tokenize(flight.get(field)):
+                terms[term] = terms.get(term, 0) | bit
+
+        self._flights[flight_id] = flight
+        self._doc_terms[flight_id] = terms
+        self._dates[flight_id] = str(flight.get("date") or "")
+        self._by_unit.setdefault((flight.get("unit") or "").strip(), set()).add(flight_id)
+        for term, mask in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                insort(self._vocab, term)
+            postings[flight_id] = mask
+            if mask & _FUZZY_MASK:
+                count = self._fuzzy_docs.get(term, 0)
+                self._fuzzy_docs[term] = count + 1
+                if not count:
+                    for gram in trigrams(term):
+                        self._trigrams.setdefault(gram, set()).add(term)
+
+    def remove(self, flight_id: int):
+        flight = self._flights.pop(flight_id, None)
+        if flight is None:
+            return
+        self._dates.pop(flight_id, None)
+        unit_ids = self._by_unit.get((flight.get("unit") or "").strip())
+        if unit_ids is not None:
+            unit_ids.discard(flight_id)
+        for term, mask in self._doc_terms.pop(flight_id).items():
+            postings = self._postings[term]
+            postings.pop(flight_id, None)
+            if not postings:
+                # Слово більше ніде не трапляється — прибираємо зі словника
+                del self._postings[term]
+                del self._vocab[bisect_left(self._vocab, term)]
+            if mask & _FUZZY_MASK:
+                count = self._fuzzy_docs[term] - 1
+                if count:
+                    self._fuzzy_docs[term] = count
+                    continue
+                # ...і з триграм, коли воно зникло з усіх полів нечіткого пошуку
+                del self._fuzzy_docs[term]
+                for gram in trigrams(term):
+                    bucket = self._trigrams.get(gram)
+                    if bucket is not None:
+                        bucket.discard(term)
+                        if not bucket:
+                            del self._trigrams[gram]
+
+    def patch(self, flight_id: int, changes: dict):
+        flight = self._flights.get(flight_id)
+        if flight is not None:
+            self.upsert({**flight, **changes})
+
+    def apply_event(self, event: dict):
+        """Застосовує подію запису з ``EventBroker`` (формат як у SSE)."""
+        event_type = event.get("type")
+        if event_type == "flight_added":
+            self.upsert(event["flight"])
+        elif event_type == "flight_updated":
+            self.patch(event["id"], {k: v for k, v in event.items() if k not in ("type", "unit", "id")})
+        elif event_type == "flight_deleted":
+            self.remove(event["id"])
+        elif event_type == "flights_bulk_updated":
+            for flight_id, changes in event["changes"].items():
+                self.patch(int(flight_id), changes)
+        elif event_type == "flights_bulk_deleted":
+            for flight_id in event["ids"]:
+                self.remove(flight_id)
+
+    # --- ПОШУК ---
+
+    def _expand(self, term: str) -> Dict[str, tuple]:
+        """Слова словника, що відповідають слову запиту: слово -> (якість збігу, маска полів, де збіг рахується)."""
+        matches = {}
+        if term in self._postings:
+            matches[term] = (1.0, _ALL_MASK)
+
+        i = bisect_left(self._vocab, term)
+        while i < len(self._vocab) and self._vocab[i].startswith(term) and len(matches) < MAX_PREFIX_EXPANSIONS:
+            candidate = self._vocab[i]
+            if candidate != term:
+                matches[candidate] = (PREFIX_FACTOR * (0.5 + 0.5 * len(term) / len(candidate)), _ALL_MASK)
+            i += 1
+
+        if len(term) >= FUZZY_MIN_LENGTH:
+            # Одруківки: кандидати — слова зі спільними триграмами; приймаємо за схожістю
+            # триграм або за відстанню редагування (перестановки триграми ловлять погано)
+            grams = trigrams(term)
+            limit = _typo_limit(term)
+            overlap: Dict[str, int] = {}
+            for gram in grams:
+                for candidate in self._trigrams.get(gram, ()):
+                    overlap[candidate] = overlap.get(candidate, 0) + 1
+            scored = []
+            for candidate, common in overlap.items():
+                if candidate in matches:
+                    continue
+                # Жаккар за триграмами; у слова-кандидата їх len(candidate) (з урахуванням меж $)
+                similarity = common / (len(grams) + len(candidate) - common)
+                if similarity < FUZZY_MIN_SIMILARITY:
+                    distance = edit_distance(term, candidate, limit)
+                    if distance > limit:
+                        continue
+                    similarity = max(similarity, 1 - distance / max(len(term), len(candidate)))
+                scored.append((similarity, candidate))
+            for similarity, candidate in heapq.nlargest(MAX_EXPANSIONS, scored):
+                matches[candidate] = (FUZZY_FACTOR * similarity, _FUZZY_MASK)
+        return matches
+
+    def search(
+        self,
+        query: str = "",
+        unit: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        offset: int = 0,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+    ) -> dict:
+        """Сторінка результатів: рейтинг за спаданням, за рівного рейтингу — новіші (більший id) першими."""
+        started = time.perf_counter()
+        terms = list(dict.fromkeys(tokenize(query)))
+        allowed = self._by_unit.get(unit.strip(), set()) if unit else None
+
+        # Найрідкісніші слова першими: далі перевіряються лише польоти, що вже пройшли
+        expansions = sorted(
+            (self._expand(term) for term in terms),
+            key=lambda m: sum(len(self._postings[c]) for c in m)
+        )
+        scores: Optional[Dict[int, float]] = None
+        for matches in expansions:
+            term_scores: Dict[int, float] = {}
+            for candidate, (quality, field_mask) in matches.items():
+                postings = self._postings[candidate]
+                if scores is None:
+                    pairs = postings.items()
+                elif len(scores) < len(postings):
+                    pairs = ((i, postings[i]) for i in scores if i in postings)
+                else:
+                    pairs = ((i, m) for i, m in postings.items() if i in scores)
+                for flight_id, mask in pairs:
+                    # Нечіткий збіг зі словом, що в цьому польоті є лише в номері АКБ чи результаті, — не збіг
+                    mask &= field_mask
+                    if not mask:
+                        continue
+                    score = quality * _MASK_WEIGHTS[mask]
+                    if score > term_scores.get(flight_id, 0.0):
+                        term_scores[flight_id] = score
+            # Усі слова запиту обов'язкові: сумуємо лише для польотів, що знайшлись за кожним
+            scores = term_scores if scores is None else {i: scores[i] + s for i, s in term_scores.items()}
+            if not scores:
+                break
+
+        if scores is not None:
+            hits = [(round(score, 6), i) for i, score in scores.items() if allowed is None or i in allowed]
+        else:
+            # Без тексту — лише фільтри, новіші першими
+            hits = [(0.0, i) for i in (allowed if allowed is not None else self._flights)]
+        if date_from or date_to:
+            dates = self._dates
+            hits = [h for h in hits if (not date_from or dates[h[1]] >= date_from) and (not date_to or dates[h[1]] <= date_to)]
+
+        ranked = heapq.nlargest(offset + limit, hits)[offset:]
+        return {
+            "total": len(hits),
+            "offset": offset,
+            "limit": limit,
+            "took_ms": round((time.perf_counter() - started) * 1000, 2),
+            "hits": [{"score": round(score, 3), "flight": self._flights[i]} for score, i in ranked],
+        }
+
+
+class FlightSearch:
+    """Індекс, що перебудовується у фоні й підміняється, не гублячи подій за час перебудови.
+
+    ``apply_event`` викликається з циклу подій і не блокує: подія стає в чергу.
+    ``search`` — для пулу потоків: під блокуванням доганяє чергу й шукає.
+    """
+
+    def __init__(self):
+        self.index = FlightSearchIndex()
+        self.built_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._queue: deque = deque()
+        self._pending: Optional[list] = None
+
+    @property
+    def is_warm(self) -> bool:
+        return self.built_at is not None
+
+    def apply_event(self, event: dict):
+        self._queue.append(event)
+        if self._pending is not None:
+            self._pending.append(event)
+
+    def _drain(self):
+        while self._queue:
+            self.index.apply_event(self._queue.popleft())
+
+    async def rebuild(self, load_flights: Callable[[], Iterable[dict]]):
+        """Будує новий індекс у пулі потоків; події, що прийшли тим часом, доганяються перед підміною."""
+        self._pending = []
+        try:
+            fresh = await run_in_threadpool(lambda: FlightSearchIndex.build(load_flights()))
+            await run_in_threadpool(self._swap, fresh)
+            self.built_at = time.time()
+        finally:
+            self._pending = None
+
+    def _swap(self, fresh: FlightSearchIndex):
+        with self._lock:
+            # Події повторюються ідемпотентно: частина з них уже могла потрапити в завантажені дані
+            for event in list(self._pending):
+                fresh.apply_event(event)
+            self.index = fresh
+            self._drain()
+
+    def search(self, *args, **kwargs) -> dict:
+        with self._lock:
+            self._drain()
+            return self.index.search(*args, **kwargs)
+
+    def status(self) -> dict:
+        return {"warm": self.is_warm, "flights": len(self.index), "built_at": self.built_at}
@@ -0,0 +1,220 @@
+"""Спільний стан для кількох воркерів / інстансів.
+
+Два бекенди з однаковим інтерфейсом:
+  * ``SQLiteState`` — файл на локальному диску (воркери одного хоста);
+  * ``RedisState`` — мережевий, для кількох хостів (``SHARED_STATE_URL=redis://...``).
+
+Що дає:
+  * ключ-значення з TTL (список файлів бази знань);
+  * оренди (leases) — вибір одного лідера для разових задач старту;
+  * спільний журнал подій, через який SSE-події доходять до всіх воркерів.
+"""
+import json
+import os
+import socket
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+from app.core.sqlite_db import SQLiteDB
+
+EVENT_LOG_KEEP = 5000
+
+
+def make_owner_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def local_lease(name: str, path: str) -> str:
+    """Ім'я оренди для задачі над локальним файлом (репліка, медіа).
+
+    Файл у кожного хоста свій, тож і лідер потрібен на кожному хості — з Redis
+    спільна оренда ``name`` залишила б інші хости без синхронізації.
+    """
+    return f"{name}:{socket.gethostname()}:{os.path.abspath(path)}"
+
+
+class SharedState:
+    """Базовий інтерфейс. Значення — bytes; для JSON є ``get_json``/``set_json``."""
+
+    # Чи вміє read_events чекати нових подій (інакше викликач опитує з паузою)
+    blocking_reads = False
+
+    def __init__(self):
+        self.owner_id = make_owner_id()
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def pop(self, key: str) -> Optional[bytes]:
+        """Атомарно читає і видаляє ключ (одноразові токени)."""
+        raise NotImplementedError
+
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        """Намагається стати власником оренди ``name``. Повторний виклик власником — продовжує її."""
+        raise NotImplementedError
+
+    def release_lease(self, name: str):
+        raise NotImplementedError
+
+    def append_event(self, payload: bytes) -> int:
+        raise NotImplementedError
+
+    def read_events(self, after_seq: int, limit: int = 500, block_ms: int = 0) -> List[Tuple[int, bytes]]:
+        raise NotImplementedError
+
+    def last_event_seq(self) -> int:
+        raise NotImplementedError
+
+    def log_id(self) -> str:
+        """Ідентифікатор журналу подій — змінюється, якщо журнал створено заново."""
+        raise NotImplementedError
+
+    def get_json(self, key: str):
+        raw = self.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set_json(self, key: str, value, ttl: Optional[float] = None):
+        self.set(key, json.dumps(value, ensure_ascii=False).encode("utf-8"), ttl)
+
+
+class SQLiteState(SharedState):
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._db = SQLiteDB(path)
+        with self._db.transaction() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT, expires_at REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY AUTOINCREMENT, payload BLOB)")
+            db.execute(
+                "INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES ('__log_id__', ?, NULL)",
+                (uuid.uuid4().hex[:12].encode(),)
+            )
+
+    def get(self, key):
+        row = self._db.conn().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._db.transaction() as db:
+            db.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at))
+            db.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+    def pop(self, key):
+        with self._db.transaction() as db:
+            row = db.execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+            ).fetchone()
+            db.execute("DELETE FROM kv WHERE key = ?", (key,))
+        return row[0] if row else None
+
+    def acquire_lease(self, name, ttl):
+        now = time.time()
+        with self._db.transaction() as db:
+            row = db.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row and row[0] != self.owner_id and row[1] > now:
+                return False
+            db.execute("INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)", (name, self.owner_id, now + ttl))
+        return True
+
+    def release_lease(self, name):
+        with self._db.transaction() as db:
+            db.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.owner_id))
+
+    def append_event(self, payload):
+        with self._db.transaction() as db:
+            seq = db.execute("INSERT INTO events (payload) VALUES (?)", (payload,)).lastrowid
+            if seq % 500 == 0:
+                db.execute("DELETE FROM events WHERE seq <= ?", (seq - EVENT_LOG_KEEP,))
+        return seq
+
+    def read_events(self, after_seq, limit=500, block_ms=0):
+        # SQLite не вміє чекати нових рядків — паузу між опитуваннями робить викликач
+        return self._db.conn().execute(
+            "SELECT seq, payload FROM events WHERE seq > ? ORDER BY seq LIMIT ?", (after_seq, limit)
+        ).fetchall()
+
+    def last_event_seq(self):
+        row = self._db.conn().execute("SELECT MAX(seq) FROM events").fetchone()
+        return row[0] or 0
+
+    def log_id(self):
+        return self.get("__log_id__").decode()
+
+
+class RedisState(SharedState):
+    blocking_reads = True
+
+    def __init__(self, url: str, prefix: str = "uav:"):
+        super().__init__()
+        import redis  # необов'язкова залежність — лише для мережевого бекенду
+
+        self.redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._events_key = prefix + "events"
+        self.redis.set(prefix + "__log_id__", uuid.uuid4().hex[:12], nx=True)
+        # INCR + XADD одним скриптом: інакше паралельні воркери можуть додати seq не по порядку
+        self._append = self.redis.register_script(
+            "local seq = redis.call('INCR', KEYS[2]) "
+            "redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[2], seq .. '-0', 'p', ARGV[1]) "
+            "return seq"
+        )
+
+    def get(self, key):
+        return self.redis.get(self.prefix + key)
+
+    def set(self, key, value, ttl=None):
+        self.redis.set(self.prefix + key, value, px=int(ttl * 1000) if ttl else None)
+
+    def pop(self, key):
+        return self.redis.getdel(self.prefix + key)
+
+    def acquire_lease(self, name, ttl):
+        key = f"{self.prefix}lease:{name}"
+        if self.redis.set(key, self.owner_id, nx=True, px=int(ttl * 1000)):
+            return True
+        # Продовження власної оренди
+        if (self.redis.get(key) or b"").decode() == self.owner_id:
+            self.redis.pexpire(key, int(ttl * 1000))
+            return True
+        return False
+
+    def release_lease(self, name):
+        key = f"{self.prefix}lease:{name}"
+        if (self.redis.get(key) or b"").decode() == self.owner_id:
+            self.redis.delete(key)
+
+    @staticmethod
+    def _seq(stream_id: bytes) -> int:
+        # Ідентифікатори потоку ми задаємо самі як "<seq>-0"
+        return int(stream_id.split(b"-")[0])
+
+    def append_event(self, payload):
+        return int(self._append(keys=[self._events_key, self.prefix + "events:seq"], args=[payload, EVENT_LOG_KEEP]))
+
+    def read_events(self, after_seq, limit=500, block_ms=0):
+        res = self.redis.xread({self._events_key: f"{after_seq}-0"}, count=limit, block=block_ms or None)
+        if not res:
+            return []
+        return [(self._seq(entry_id), fields[b"p"]) for entry_id, fields in res[0][1]]
+
+    def last_event_seq(self):
+        return int(self.redis.get(self.prefix + "events:seq") or 0)
+
+    def log_id(self):
+        return self.redis.get(self.prefix + "__log_id__").decode()
+
+
+def create_shared_state(default_path: str) -> SharedState:
+    """Бекенд за змінною ``SHARED_STATE_URL``: ``redis://...`` або шлях до SQLite-файлу."""
+    url = os.environ.get("SHARED_STATE_URL", "")
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisState(url)
+    return SQLiteState(url.removeprefix("sqlite:///") if url else default_path)
@@ -0,0 +1,39 @@
+"""Спільна обгортка над локальними SQLite-файлами (спільний стан, репліка, медіа).
+
+З'єднання одне на потік: ``sqlite3.Connection`` не можна ділити між потоками,
+а ендпоінти й фонові задачі працюють у пулі потоків. Режим WAL дозволяє
+читати, поки інший воркер пише.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class SQLiteDB:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self.conn()
+        # IMMEDIATE — блокування запису одразу, щоб перевірка+запис були атомарні між процесами
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
@@ -0,0 +1,206 @@
+"""Швидкий старт: ліниві клієнти та облік часу запуску.
+
+Важкі модулі (``supabase``, ``google.genai``, ``httpx``) імпортуються всередині
+фабрик ``LazyResource`` — при першому зверненні або фоновим прогрівом, коли
+сервер уже приймає запити. ``StartupTimer`` записує, скільки забрала кожна
+фаза, для ``/api/health/startup``.
+
+Цикл подій ніколи не чекає на імпорт: ``WarmupGate`` притримує запити до API,
+доки клієнт не прогріється (очікування асинхронне), а ``get`` з циклу подій
+для непрогрітого клієнта одразу кидає ``ResourceNotReady``.
+"""
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional, Sequence
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+WARMUP_WAIT_TIMEOUT = 15.0
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._last_lap = self._t0
+        self.phases = []
+        self.marks = {}
+
+    def _ms(self, t: float) -> float:
+        return round((t - self._t0) * 1000, 1)
+
+    def _record(self, name: str, start: float, end: float, status: str = "ok"):
+        self.phases.append({"phase": name, "start_ms": self._ms(start), "duration_ms": round((end - start) * 1000, 1), "status": status})
+
+    def lap(self, name: str):
+        """Фаза від попереднього ``lap`` до цієї миті (послідовний код модуля)."""
+        now = time.perf_counter()
+        self._record(name, self._last_lap, now)
+        self._last_lap = now
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self._record(name, start, time.perf_counter(), status)
+
+    def mark(self, name: str):
+        """Разова подія (``listening``, ``first_request``) — перша мітка не перезаписується."""
+        self.marks.setdefault(name, self._ms(time.perf_counter()))
+
+    def report(self) -> dict:
+        return {
+            "started_at": self.started_at,
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "phases": list(self.phases),
+            "marks": dict(self.marks),
+        }
+
+    def summary(self) -> str:
+        return ", ".join(f"{p['phase']} {p['duration_ms']:.0f} мс" for p in self.phases)
+
+
+class ResourceNotReady(RuntimeError):
+    pass
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class LazyResource:
+    """Клієнт, що створюється при першому зверненні; атрибути проксіюються на сам клієнт.
+
+    ``bool(resource)`` — чи налаштований він узагалі (є ключі в env), без створення.
+    Створення (імпорт важких модулів) — лише в пулі потоків, через ``warm``.
+    """
+
+    def __init__(self, name: str, factory: Callable, enabled: bool = True, timer: Optional[StartupTimer] = None):
+        self._name = name
+        self._factory = factory
+        self._enabled = enabled
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._value = None
+        self._ready = False
+        self._error = None
+        self._warming: Optional[asyncio.Future] = None
+
+    def get(self):
+        if self._ready:
+            return self._value
+        if not self._enabled:
+            raise RuntimeError(f"{self._name} is not configured")
+        if _on_event_loop():
+            # Блокування тут зупинило б усі запити воркера, включно з /api/health/live
+            raise ResourceNotReady(f"{self._name} is warming up")
+        with self._lock:
+            if not self._ready:
+                try:
+                    if self._timer is not None:
+                        with self._timer.phase(self._name):
+                            self._value = self._factory()
+                    else:
+                        self._value = self._factory()
+                except Exception as e:
+                    self._error = str(e)
+                    raise
+                self._error = None
+                self._ready = True
+        return self._value
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    async def warm(self):
+        """Прогрів у пулі потоків; одночасні виклики чекають одного й того ж.
+
+        Помилка лише запам'ятовується — наступний виклик спробує ще раз.
+        """
+        if not self._enabled or self._ready:
+            return
+        if self._warming is None:
+            self._warming = asyncio.ensure_future(self._warm())
+        await asyncio.shield(self._warming)
+
+    async def _warm(self):
+        try:
+            await run_in_threadpool(self.get)
+        except Exception as e:
+            print(f"⚠️ Не вдалось ініціалізувати {self._name}: {e}")
+        finally:
+            self._warming = None
+
+    @property
+    def is_warm(self) -> bool:
+        return self._ready
+
+    def status(self) -> dict:
+        return {"configured": self._enabled, "warm": self._ready, "error": self._error}
+
+    def __bool__(self) -> bool:
+        return self._enabled
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.get(), attr)
+
+
+class WarmupGate:
+    """ASGI-middleware: запит до API чекає прогріву клієнтів (асинхронно), поки вони не готові.
+
+    Якщо прогрів не вдався або не вклався в ``timeout`` — 503, щоб клієнт повторив пізніше.
+    """
+
+    def __init__(self, app, resources: Sequence[LazyResource], prefix: str = "/api/",
+                 exempt: Sequence[str] = ("/api/health/",), timeout: float = WARMUP_WAIT_TIMEOUT):
+        self.app = app
+        self.resources = resources
+        self.prefix = prefix
+        self.exempt = tuple(exempt)
+        self.timeout = timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.prefix) and not scope["path"].startswith(self.exempt):
+            for resource in self.resources:
+                if not resource or resource.is_warm:
+                    continue
+                try:
+                    await asyncio.wait_for(resource.warm(), self.timeout)
+                except asyncio.TimeoutError:
+                    pass
+                if not resource.is_warm:
+                    response = JSONResponse({"detail": f"{resource.name} is not ready"}, status_code=503, headers={"Retry-After": "5"})
+                    await response(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
+
+
+class FirstRequestMarker:
+    """ASGI-middleware: мітка ``first_request`` у таймері; далі — лише прохід без затрат."""
+
+    def __init__(self, app, timer: StartupTimer):
+        self.app = app
+        self.timer = timer
+        self._seen = False
+
+    async def __call__(self, scope, receive, send):
+        if not self._seen and scope["type"] == "http":
+            self._seen = True
+            self.timer.mark("first_request")
+        await self.app(scope, receive, send)
@@ -0,0 +1,80 @@
+"""Потокова віддача великих JSON-списків.
+
+Рядки кодуються посторінково, щойно сторінка прийшла з бази, тому перший
+байт іде клієнту після першої сторінки, а в пам'яті тримається лише одна.
+"""
+import json
+from typing import Callable, Iterable, Iterator, List
+
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import orjson
+except ImportError:  # без orjson — стандартний json, формат той самий
+    orjson = None
+
+DEFAULT_PAGE_SIZE = 1000
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def iter_range_pages(fetch_page: Callable[[int, int], List[dict]], page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[List[dict]]:
+    """Гортає ``fetch_page(start, end)`` (включний діапазон, як у Supabase ``.range``) до неповної сторінки."""
+    start = 0
+    while True:
+        batch = fetch_page(start, start + page_size - 1)
+        if not batch:
+            break
+        yield batch
+        if len(batch) < page_size:
+            break
+        start += page_size
+
+
+def encode_json_array(pages: Iterable[List[dict]]) -> Iterator[bytes]:
+    """Кодує послідовність сторінок як один JSON-масив, шматок на сторінку."""
+    yield b"["
+    first = True
+    for page in pages:
+        body = dumps(page)[1:-1]
+        if not body:
+            continue
+        yield body if first else b"," + body
+        first = False
+    yield b"]"
+
+
+def encode_raw_json_array(pages: Iterable[List[str]]) -> Iterator[bytes]:
+    """Те саме для сторінок уже закодованих JSON-рядків (локальна репліка зберігає рядки готовими)."""
+    yield b"["
+    first = True
+    for page in pages:
+        if not page:
+            continue
+        body = ",".join(page).encode("utf-8")
+        yield body if first else b"," + body
+        first = False
+    yield b"]"
+
+
+async def stream_json_pages(fetch_page: Callable[[int, int], List[dict]], page_size: int = DEFAULT_PAGE_SIZE) -> StreamingResponse:
+    """Відповідь-потік для таблиці, що гортається сторінками.
+
+    Першу сторінку запитуємо ще до початку відповіді: якщо база недоступна,
+    клієнт отримає звичайну помилку 500, а не обірваний JSON.
+    """
+    pages = iter_range_pages(fetch_page, page_size)
+    first_page = await run_in_threadpool(next, pages, None)
+
+    def chained():
+        if first_page is not None:
+            yield first_page
+            yield from pages
+
+    # Синхронний генератор Starlette сам ганяє у пулі потоків — запити до бази не блокують цикл подій
+    return StreamingResponse(encode_json_array(chained()), media_type="application/json")
@@ -0,0 +1,315 @@
+"""Локальна SQLite-репліка таблиць ``flights``, ``drones`` та ``app_settings``.
+
+Фонова задача (``sync`` під орендою в одному воркері хоста) підтягує дані з Supabase,
+а ``apply_event`` між синхронізаціями застосовує події запису з усіх воркерів і хостів,
+а ендпоінти читання беруть їх звідси: запити за індексами — долі мілісекунди,
+і пости працюють далі, навіть коли зв'язок із Supabase зник.
+
+Кожен рядок зберігається цілком як JSON (``data``) — набір колонок у Supabase
+може змінюватись; окремо винесені лише поля, за якими фільтруємо.
+"""
+import json
+import time
+from functools import wraps
+from typing import Dict, Iterator, List, Optional
+
+from app.core.sqlite_db import SQLiteDB
+from app.core.streaming import dumps
+
+FLIGHT_COLUMNS = ("unit", "operator", "date", "shift_time", "drone", "result", "route", "battery_id")
+# Колонки для фільтрів зберігаються обрізаними: у Supabase трапляються назви з пробілами по краях
+TRIMMED_COLUMNS = ("unit",)
+_WHITESPACE = " \t\r\n"
+PAGE_SIZE = 1000
+
+
+def _best_effort(fn):
+    """Запис у репліку не повинен ламати запит, який уже успішно пройшов у Supabase."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            print(f"Помилка запису в локальну репліку ({fn.__name__}): {e}")
+    return wrapper
+
+
+class LocalReplica:
+    def __init__(self, path: str):
+        self.path = path
+        self._db = SQLiteDB(path)
+        with self._db.transaction() as db:
+            columns = ", ".join(f"{c} TEXT" for c in FLIGHT_COLUMNS)
+            db.execute(f"CREATE TABLE IF NOT EXISTS flights (id INTEGER PRIMARY KEY, {columns}, data TEXT NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_flights_unit_operator_date ON flights (unit, operator, date)")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_flights_unit_date ON flights (unit, date)")
+            db.execute("CREATE TABLE IF NOT EXISTS drones (id INTEGER PRIMARY KEY, unit TEXT, data TEXT NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_drones_unit ON drones (unit)")
+            db.execute("CREATE TABLE IF NOT EXISTS app_settings (id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+            db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            # Репліки, записані до обрізання колонок
+            for column in TRIMMED_COLUMNS:
+                db.execute(f"UPDATE flights SET {column} = TRIM({column}, ?) WHERE {column} != TRIM({column}, ?)", (_WHITESPACE, _WHITESPACE))
+
+    # --- СТАН ---
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._db.conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, db, key: str, value):
+        db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def is_ready(self) -> bool:
+        """Репліка придатна для читання після першої повної синхронізації."""
+        return self._meta("flights_full_sync_at") is not None
+
+    def synced_at(self) -> Optional[float]:
+        value = self._meta("synced_at")
+        return float(value) if value else None
+
+    def status(self) -> dict:
+        synced_at = self.synced_at()
+        return {
+            "ready": self.is_ready(),
+            "synced_at": synced_at,
+            "age_seconds": round(time.time() - synced_at, 1) if synced_at else None,
+            "flights": self._db.conn().execute("SELECT COUNT(*) FROM flights").fetchone()[0],
+            "last_error": self._meta("last_error") or None,
+        }
+
+    # --- ЗАПИС ---
+
+    @staticmethod
+    def _flight_params(row: dict) -> tuple:
+        values = []
+        for column in FLIGHT_COLUMNS:
+            value = row.get(column)
+            if value is not None:
+                value = str(value).strip(_WHITESPACE) if column in TRIMMED_COLUMNS else str(value)
+            values.append(value)
+        return (row["id"], *values, dumps(row).decode("utf-8"))
+
+    def _upsert_flights(self, db, rows: List[dict]):
+        placeholders = ", ".join("?" * (len(FLIGHT_COLUMNS) + 2))
+        db.executemany(
+            f"INSERT OR REPLACE INTO flights (id, {', '.join(FLIGHT_COLUMNS)}, data) VALUES ({placeholders})",
+            [self._flight_params(r) for r in rows if r.get("id") is not None]
+        )
+
+    @_best_effort
+    def upsert_flights(self, rows: List[dict]):
+        with self._db.transaction() as db:
+            self._upsert_flights(db, rows)
+
+    @_best_effort
+    def patch_flight(self, flight_id: int, changes: dict):
+        self._patch_flights({flight_id: changes})
+
+    def _patch_flights(self, changes: Dict[int, dict]):
+        # Читання й запис в одній транзакції — паралельна правка іншого поля не загубиться
+        with self._db.transaction() as db:
+            rows = []
+            for flight_id, row_changes in changes.items():
+                row = db.execute("SELECT data FROM flights WHERE id = ?", (flight_id,)).fetchone()
+                if row is not None:
+                    rows.append({**json.loads(row[0]), **row_changes})
+            self._upsert_flights(db, rows)
+
+    @_best_effort
+    def delete_flights(self, ids: List[int]):
+        with self._db.transaction() as db:
+            db.executemany("DELETE FROM flights WHERE id = ?", [(i,) for i in ids])
+
+    @_best_effort
+    def upsert_drones(self, rows: List[dict]):
+        with self._db.transaction() as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO drones (id, unit, data) VALUES (?, ?, ?)",
+                [(r["id"], r.get("unit"), dumps(r).decode("utf-8")) for r in rows if r.get("id") is not None]
+            )
+
+    @_best_effort
+    def delete_drones(self, ids: List[int]):
+        with self._db.transaction() as db:
+            db.executemany("DELETE FROM drones WHERE id = ?", [(i,) for i in ids])
+
+    def _patch_drone(self, drone_id: int, changes: dict):
+        with self._db.transaction() as db:
+            row = db.execute("SELECT data FROM drones WHERE id = ?", (drone_id,)).fetchone()
+            if row is not None:
+                drone = {**json.loads(row[0]), **changes}
+                db.execute("UPDATE drones SET unit = ?, data = ? WHERE id = ?", (drone.get("unit"), dumps(drone).decode("utf-8"), drone_id))
+
+    @_best_effort
+    def patch_settings(self, settings_id: int, changes: dict):
+        current = self.get_settings(settings_id) or {"id": settings_id}
+        with self._db.transaction() as db:
+            db.execute("INSERT OR REPLACE INTO app_settings (id, data) VALUES (?, ?)",
+                       (settings_id, dumps({**current, **changes}).decode("utf-8")))
+
+    # --- ПОДІЇ ЗАПИСУ ---
+
+    @_best_effort
+    def apply_event(self, event: dict):
+        """Застосовує подію з ``EventBroker`` — зміни з інших хостів видно до наступної синхронізації.
+
+        Викликається в пулі потоків, по одній події за раз і в порядку журналу.
+        """
+        event_type = event.get("type")
+        if event_type == "flight_added":
+            self.upsert_flights([event["flight"]])
+        elif event_type == "flight_updated":
+            self._patch_flights({event["id"]: {k: v for k, v in event.items() if k not in ("type", "unit", "id")}})
+        elif event_type == "flight_deleted":
+            self.delete_flights([event["id"]])
+        elif event_type == "flights_bulk_updated":
+            self._patch_flights({int(i): changes for i, changes in event["changes"].items()})
+        elif event_type == "flights_bulk_deleted":
+            self.delete_flights(event["ids"])
+        elif event_type == "drone_added":
+            self.upsert_drones([event["drone"]])
+        elif event_type == "drone_updated":
+            self._patch_drone(event["id"], {k: v for k, v in event.items() if k not in ("type", "unit", "id")})
+        elif event_type == "drone_deleted":
+            self.delete_drones([event["id"]])
+        elif event_type == "announcement":
+            self.patch_settings(1, {"announcement_text": event["text"], "is_announcement_active": event["is_active"]})
+
+    # --- СИНХРОНІЗАЦІЯ З SUPABASE ---
+
+    def sync(self, client, full: bool = False):
+        """Один цикл синхронізації. ``full`` — повна звірка flights (ловить правки та видалення в обхід API)."""
+        try:
+            if full or not self.is_ready() or self._meta("flights_watermark") is None:
+                self._sync_flights_full(client)
+            else:
+                self._sync_flights_new(client)
+            drones = client.table("drones").select("*").execute().data or []
+            settings = client.table("app_settings").select("*").execute().data or []
+            with self._db.transaction() as db:
+                db.execute("DELETE FROM drones")
+                db.executemany("INSERT INTO drones (id, unit, data) VALUES (?, ?, ?)",
+                               [(r["id"], r.get("unit"), dumps(r).decode("utf-8")) for r in drones])
+                db.execute("DELETE FROM app_settings")
+                db.executemany("INSERT INTO app_settings (id, data) VALUES (?, ?)",
+                               [(r["id"], dumps(r).decode("utf-8")) for r in settings])
+                self._set_meta(db, "synced_at", time.time())
+                self._set_meta(db, "last_error", "")
+        except Exception as e:
+            with self._db.transaction() as db:
+                self._set_meta(db, "last_error", f"{time.strftime('%H:%M:%S')} {e}")
+            raise
+
+    def _sync_flights_full(self, client):
+        seen_ids = []
+        start = 0
+        # Сторінки тягнемо поза транзакцією — мережа не тримає блокування файлу
+        while True:
+            batch = client.table("flights").select("*").order("id").range(start, start + PAGE_SIZE - 1).execute().data
+            if not batch:
+                break
+            with self._db.transaction() as db:
+                self._upsert_flights(db, batch)
+            seen_ids.extend(r["id"] for r in batch)
+            if len(batch) < PAGE_SIZE:
+                break
+            start += PAGE_SIZE
+
+        with self._db.transaction() as db:
+            db.execute("CREATE TEMP TABLE IF NOT EXISTS seen_ids (id INTEGER PRIMARY KEY)")
+            db.execute("DELETE FROM seen_ids")
+            db.executemany("INSERT OR IGNORE INTO seen_ids (id) VALUES (?)", [(i,) for i in seen_ids])
+            # Рядки новіші за знімок могли прийти записом через API під час обходу — їх не чіпаємо
+            db.execute("DELETE FROM flights WHERE id <= ? AND id NOT IN (SELECT id FROM seen_ids)", (max(seen_ids, default=0),))
+            self._set_meta(db, "flights_watermark", max(seen_ids, default=0))
+            self._set_meta(db, "flights_full_sync_at", time.time())
+
+    def _sync_flights_new(self, client):
+        # Не MAX(id) репліки: туди пишуть і ендпоінти цього хоста, а інший хост міг тим часом
+        # записати менший id. Водяний знак рухає лише синхронізація — за тим, що бачила в Supabase
+        watermark = int(self._meta("flights_watermark"))
+        while True:
+            batch = client.table("flights").select("*").gt("id", watermark).order("id").limit(PAGE_SIZE).execute().data
+            if not batch:
+                break
+            watermark = batch[-1]["id"]
+            with self._db.transaction() as db:
+                self._upsert_flights(db, batch)
+                self._set_meta(db, "flights_watermark", watermark)
+            if len(batch) < PAGE_SIZE:
+                break
+
+    # --- ЧИТАННЯ ---
+
+    def get_flight(self, flight_id: int) -> Optional[dict]:
+        row = self._db.conn().execute("SELECT data FROM flights WHERE id = ?", (flight_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def iter_flight_json_pages(self, unit: Optional[str] = None, page_size: int = PAGE_SIZE) -> Iterator[List[str]]:
+        """Сторінки готових JSON-рядків (новіші першими) — без декодування/кодування на кожен рядок."""
+        last_id = None
+        while True:
+            # З'єднання беремо на кожну сторінку: StreamingResponse може гортати генератор з різних потоків
+            conn = self._db.conn()
+            clauses, params = [], []
+            if unit:
+                clauses.append("unit = ?")
+                params.append(unit)
+            if last_id is not None:
+                clauses.append("id < ?")
+                params.append(last_id)
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+            rows = conn.execute(f"SELECT id, data FROM flights {where} ORDER BY id DESC LIMIT ?", (*params, page_size)).fetchall()
+            if not rows:
+                break
+            yield [r[1] for r in rows]
+            if len(rows) < page_size:
+                break
+            last_id = rows[-1][0]
+
+    def get_flights(self, unit: Optional[str] = None, date: Optional[str] = None, operator: Optional[str] = None) -> List[dict]:
+        """Польоти за фільтрами (індекси unit/operator/date), новіші першими; ``unit`` — без пробілів по краях."""
+        clauses, params = [], []
+        for column, value in (("unit", unit), ("operator", operator), ("date", date)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._db.conn().execute(f"SELECT data FROM flights {where} ORDER BY id DESC", params).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def get_mission_flights(self, unit: str, operator: Optional[str] = None, before: Optional[tuple] = None, limit: int = 20) -> List[dict]:
+        """Польоти ``limit + 1`` найновіших місій (date, shift_time, operator), старших за ``before``.
+
+        Зайва місія потрібна, щоб знати, чи є наступна сторінка.
+        """
+        key_sql = "COALESCE(date, ''), COALESCE(shift_time, ''), COALESCE(operator, '')"
+        clauses, params = ["unit = ?"], [unit]
+        if operator is not None:
+            clauses.append("operator = ?")
+            params.append(operator)
+        conn = self._db.conn()
+        before_clause = f" AND ({key_sql}) < (?, ?, ?)" if before else ""
+        keys = conn.execute(
+            f"SELECT {key_sql} FROM flights WHERE {' AND '.join(clauses)}{before_clause} "
+            f"GROUP BY 1, 2, 3 ORDER BY 1 DESC, 2 DESC, 3 DESC LIMIT ?",
+            (*params, *(before or ()), limit + 1)
+        ).fetchall()
+        if not keys:
+            return []
+        # Діапазон дат бере індекс, точний відбір місій — тут
+        rows = conn.execute(
+            f"SELECT data, {key_sql} FROM flights WHERE {' AND '.join(clauses)} AND COALESCE(date, '') BETWEEN ? AND ?",
+            (*params, keys[-1][0], keys[0][0])
+        ).fetchall()
+        wanted = set(keys)
+        return [json.loads(r[0]) for r in rows if tuple(r[1:]) in wanted]
+
+    def get_drones(self, unit: str) -> List[dict]:
+        rows = self._db.conn().execute("SELECT data FROM drones WHERE unit = ? ORDER BY id", (unit,)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def get_settings(self, settings_id: int = 1) -> Optional[dict]:
+        row = self._db.conn().execute("SELECT data FROM app_settings WHERE id = ?", (settings_id,)).fetchone()
+        return json.loads(row[0]) if row else None
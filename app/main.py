@@ -1,26 +1,39 @@
+# Першим — щоб таймер запуску врахував і час імпортів
+from app.core.startup import StartupTimer, LazyResource, ResourceNotReady, WarmupGate, FirstRequestMarker
+startup_timer = StartupTimer()
+
 import os
-import httpx
+import asyncio
+import hashlib
 import json
 import re
-import uuid
+import time
 from datetime import datetime
+from contextlib import ExitStack
 from typing import Optional, List
 from urllib.parse import quote
 
-from fastapi import FastAPI, HTTPException, Form, UploadFile, File, Query, Response, BackgroundTasks
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import FastAPI, HTTPException, Form, UploadFile, File, Query, Request, Response, BackgroundTasks
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from supabase import create_client, Client
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
 from io import BytesIO
-from docx import Document
-from docx.shared import Pt, Cm
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.oxml.ns import qn
+
+from app.core.assets import AssetPipeline
+from app.core.streaming import stream_json_pages, encode_raw_json_array, iter_range_pages
+from app.core.events import EventBroker
+from app.core.shared_state import create_shared_state, local_lease
+from app.core.reports import assemble_daily_report
+from app.core.missions import build_missions, decode_cursor, mission_key, DEFAULT_MISSIONS_LIMIT, MAX_MISSIONS_LIMIT
+from app.core.media import MediaStore, MediaError, MediaTooLarge, VARIANTS as MEDIA_VARIANTS
+from app.core.search import FlightSearch, DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT
+from app.database.replica import LocalReplica
+
+# supabase, google.genai, httpx та python-docx імпортуються ліниво — при першому використанні
+startup_timer.lap("imports")
 
 # --- CONFIG & SETUP ---
 load_dotenv()
@@ -32,18 +45,44 @@ FRONTEND_DIR = os.path.join(BASE_DIR, "frontend")
 KNOWLEDGE_DIR = os.path.join(BASE_DIR, "knowledge_base")
 os.makedirs(KNOWLEDGE_DIR, exist_ok=True)
 knowledge_files_cache = [] # Тут зберігатимуться завантажені документи
+knowledge_state = {"warm": False, "error": None}
+
+# Спільний стан воркерів: SQLite-файл за замовчуванням або SHARED_STATE_URL=redis://...
+shared_state = create_shared_state(os.path.join(BASE_DIR, "var", "shared_state.sqlite3"))
+KNOWLEDGE_SYNC_LEASE = 600
+KNOWLEDGE_FILES_TTL = 24 * 3600  # Gemini зберігає завантажені файли 48 год
+DB_CLEANUP_LEASE = 300
+
+# Локальна репліка flights/drones/app_settings: читання без походу в Supabase і робота під час його недоступності
+replica = LocalReplica(os.path.join(BASE_DIR, "var", "replica.sqlite3"))
+REPLICA_SYNC_LEASE = local_lease("replica_sync", replica.path)
+REPLICA_SYNC_INTERVAL = 30
+REPLICA_FULL_SYNC_INTERVAL = 600
+
+# Зібрана статика: відбитки вмісту, gzip/br, згенерований sw.js
+STATIC_BUILD_DIR = os.path.join(BASE_DIR, "build", "static")
+asset_pipeline = AssetPipeline(FRONTEND_DIR, STATIC_BUILD_DIR)
+
+# Живі оновлення для адмінки та дашбордів (SSE), спільні для всіх воркерів
+events = EventBroker(log=shared_state)
+
+# Пошук польотів у пам'яті воркера; оновлюється тими ж подіями, що йдуть у SSE
+flight_search = FlightSearch()
+events.add_listener(flight_search.apply_event)
+SEARCH_REBUILD_INTERVAL = 600
+
+# Ті самі події -> локальна репліка: записи інших хостів видно до наступної синхронізації.
+# Черга й одна задача-споживач — події застосовуються в пулі потоків по одній, у порядку журналу
+replica_events: asyncio.Queue = asyncio.Queue()
+events.add_listener(replica_events.put_nowait)
+
+# Фото до донесень: блоби за sha256, зменшені варіанти, прибирання непотрібного
+media = MediaStore(os.path.join(BASE_DIR, "var", "media"))
+MEDIA_GC_LEASE = local_lease("media_gc", media.root)
+MEDIA_GC_INTERVAL = 3600
 
 app = FastAPI(title="UAV Command System v10.6")
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-    expose_headers=["Content-Disposition"]
-)
-
 TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
 TELEGRAM_CHAT_ID = os.environ.get("TELEGRAM_CHAT_ID")
 
@@ -51,36 +90,59 @@ URL = os.environ.get("SUPABASE_URL")
 KEY = os.environ.get("SUPABASE_KEY")
 
 if not URL or not KEY:
-    raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in .env file")
+    # Не падаємо при імпорті: сервер стартує, /api/health/ready покаже, що БД не налаштована
+    print("⚠️ SUPABASE_URL and SUPABASE_KEY must be set in .env file")
 
-# FIX: Force IPv4 for httpx to prevent [Errno 11001] getaddrinfo failed on Windows
-try:
-    # Use a custom transport that prefers IPv4
-    import socket
-    
-    # We create a custom transport that forces IPv4 by resolving with socket.AF_INET
-    class IPv4Transport(httpx.HTTPTransport):
-        def _connect(self, *args, **kwargs):
-            return super()._connect(*args, **kwargs)
-
-    transport = httpx.HTTPTransport(retries=3)
-    # Note: custom session handling for Supabase-py
-    supabase: Client = create_client(URL, KEY)
-    
-    # Force httpx to use IPv4 resolution if possible
-    # (Actually, the most robust way on Windows is often a retry or specific transport config)
-    # We'll stick to a slightly more resilient timeout and retry for now
-    custom_client = httpx.Client(transport=transport, timeout=45.0)
-    supabase.postgrest.session = custom_client
-except Exception as e:
-    print(f"Попередження налаштування httpx: {e}")
-    supabase: Client = create_client(URL, KEY)
+def create_supabase_client():
+    import httpx
+    from supabase import create_client
+
+    # FIX: Force IPv4 for httpx to prevent [Errno 11001] getaddrinfo failed on Windows
+    try:
+        transport = httpx.HTTPTransport(retries=3)
+        # Note: custom session handling for Supabase-py
+        client = create_client(URL, KEY)
+        
+        # Force httpx to use IPv4 resolution if possible
+        # (Actually, the most robust way on Windows is often a retry or specific transport config)
+        # We'll stick to a slightly more resilient timeout and retry for now
+        custom_client = httpx.Client(transport=transport, timeout=45.0)
+        client.postgrest.session = custom_client
+    except Exception as e:
+        print(f"Попередження налаштування httpx: {e}")
+        client = create_client(URL, KEY)
+    return client
 
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    ai_client = genai.Client(api_key=GEMINI_API_KEY)
-else:
-    ai_client = None
+
+def create_ai_client():
+    from google import genai
+    return genai.Client(api_key=GEMINI_API_KEY)
+
+# Клієнти створюються при першому зверненні або фоновим прогрівом після старту
+supabase = LazyResource("db", create_supabase_client, enabled=bool(URL and KEY), timer=startup_timer)
+ai_client = LazyResource("ai", create_ai_client, enabled=bool(GEMINI_API_KEY), timer=startup_timer)
+
+# Запити до API, яким потрібна БД, чекають прогріву клієнта асинхронно — цикл подій вільний
+app.add_middleware(
+    WarmupGate,
+    resources=[supabase],
+    exempt=("/api/health/", "/api/media", "/api/events", "/api/search_flights", "/api/replica_status", "/api/chat")
+)
+# CORS додається після WarmupGate, тобто обгортає його: інакше 503 «warming up» ідуть без CORS-заголовків
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["Content-Disposition"]
+)
+app.add_middleware(FirstRequestMarker, timer=startup_timer)
+
+@app.exception_handler(ResourceNotReady)
+async def resource_not_ready_handler(request: Request, exc: ResourceNotReady):
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": "5"})
 
 UNITS = [
     'впс "Кодима"', 'віпс "Загнітків"', 'віпс "Шершенці"', 'впс "Станіславка"', 
@@ -122,77 +184,203 @@ async def cleanup_database_names():
     except Exception as e:
         print(f"Помилка під час очищення бази: {e}")
 
-@app.on_event("startup")
-async def startup_event():
-    global knowledge_files_cache
+def _knowledge_fingerprint() -> str:
+    """Відбиток вмісту папки бази знань — щоб нові/змінені файли синхронізувались після деплою."""
+    entries = sorted(
+        f"{name}:{os.path.getsize(os.path.join(KNOWLEDGE_DIR, name))}:{int(os.path.getmtime(os.path.join(KNOWLEDGE_DIR, name)))}"
+        for name in os.listdir(KNOWLEDGE_DIR)
+    )
+    return hashlib.sha256("\n".join(entries).encode("utf-8")).hexdigest()[:16]
+
+def _upload_knowledge_files() -> list:
+    """Звіряє локальну папку з файлами в Gemini, довантажує відсутні. Повертає список активних файлів."""
+    active_files = []
+    # Отримуємо список файлів, які вже є в хмарі, щоб не дублювати
+    existing_files = {f.display_name: f for f in ai_client.files.list()}
     
-    # 1. Синхронізація бази знань
-    if ai_client: 
-        print("Синхронізація бази знань з Gemini...")
-        try:
-            # Отримуємо список файлів, які вже є в хмарі, щоб не дублювати
-            existing_files = {f.display_name: f for f in ai_client.files.list()}
+    # Gemini підтримує: PDF, TXT — DOCX не підтримується (Unsupported MIME type)
+    SUPPORTED_EXTENSIONS = ('.pdf', '.txt')
+    UNSUPPORTED_MIMES = ('wordprocessingml', 'officedocument')
+
+    # Скануємо локальну папку
+    for filename in os.listdir(KNOWLEDGE_DIR):
+        if filename.lower().endswith(SUPPORTED_EXTENSIONS):
+            file_path = os.path.join(KNOWLEDGE_DIR, filename)
             
-            # Gemini підтримує: PDF, TXT — DOCX не підтримується (Unsupported MIME type)
-            SUPPORTED_EXTENSIONS = ('.pdf', '.txt')
-            UNSUPPORTED_MIMES = ('wordprocessingml', 'officedocument')
-
-            # Скануємо локальну папку
-            for filename in os.listdir(KNOWLEDGE_DIR):
-                if filename.lower().endswith(SUPPORTED_EXTENSIONS):
-                    file_path = os.path.join(KNOWLEDGE_DIR, filename)
+            if filename in existing_files:
+                existing = existing_files[filename]
+                # Skip files with unsupported MIME types (e.g. DOCX)
+                file_mime = getattr(existing, 'mime_type', '') or ''
+                if any(bad in file_mime for bad in UNSUPPORTED_MIMES):
+                    print(f"⏭️ Файл {filename} має непідтримуваний тип '{file_mime}' — пропущено.")
+                    continue
+                # Skip files that are not yet ACTIVE
+                file_state = getattr(existing, 'state', None)
+                if file_state and 'ACTIVE' not in str(file_state).upper():
+                    print(f"⚠️ Файл {filename} має стан '{file_state}' — пропустити.")
+                    continue
+                print(f"Файл {filename} вже є в базі Gemini ({file_state}).")
+                active_files.append(existing)
+            else:
+                try:
+                    print(f"Завантаження {filename} до Gemini...")
+                    uploaded_file = ai_client.files.upload(file=file_path, config={'display_name': filename})
+                    active_files.append(uploaded_file)
+                except Exception:
+                    # Якщо дисплейне ім'я або ШЛЯХ з кирилицею "ламає" SDK на Windows
+                    print("⚠️ Помилка завантаження файлу (можливо через кирилицю назви). Спроба через тимчасовий файл...")
+                    import shutil
+                    import tempfile
+                    
+                    temp_dir = tempfile.gettempdir()
+                    file_ext = os.path.splitext(filename)[1]
+                    safe_temp_name = f"gemini_v3_{int(datetime.now().timestamp())}_{hash(filename)%1000}{file_ext}"
+                    temp_path = os.path.join(temp_dir, safe_temp_name)
                     
-                    if filename in existing_files:
-                        existing = existing_files[filename]
-                        # Skip files with unsupported MIME types (e.g. DOCX)
-                        file_mime = getattr(existing, 'mime_type', '') or ''
-                        if any(bad in file_mime for bad in UNSUPPORTED_MIMES):
-                            print(f"⏭️ Файл {filename} має непідтримуваний тип '{file_mime}' — пропущено.")
-                            continue
-                        # Skip files that are not yet ACTIVE
-                        file_state = getattr(existing, 'state', None)
-                        if file_state and 'ACTIVE' not in str(file_state).upper():
-                            print(f"⚠️ Файл {filename} має стан '{file_state}' — пропустити.")
-                            continue
-                        print(f"Файл {filename} вже є в базі Gemini ({file_state}).")
-                        knowledge_files_cache.append(existing)
-                    else:
-                        try:
-                            print(f"Завантаження {filename} до Gemini...")
-                            uploaded_file = ai_client.files.upload(file=file_path, config={'display_name': filename})
-                            knowledge_files_cache.append(uploaded_file)
-                        except Exception:
-                            # Якщо дисплейне ім'я або ШЛЯХ з кирилицею "ламає" SDK на Windows
-                            print("⚠️ Помилка завантаження файлу (можливо через кирилицю назви). Спроба через тимчасовий файл...")
-                            import shutil
-                            import tempfile
-                            
-                            temp_dir = tempfile.gettempdir()
-                            file_ext = os.path.splitext(filename)[1]
-                            safe_temp_name = f"gemini_v3_{int(datetime.now().timestamp())}_{hash(filename)%1000}{file_ext}"
-                            temp_path = os.path.join(temp_dir, safe_temp_name)
-                            
-                            try:
-                                # Використовуємо системне копіювання, яке краще справляється з шляхами
-                                shutil.copy2(file_path, temp_path)
-                                uploaded_file = ai_client.files.upload(file=temp_path, config={'display_name': safe_temp_name})
-                                knowledge_files_cache.append(uploaded_file)
-                                print(f"✅ Успішно завантажено (через temp): {safe_temp_name}")
-                                if os.path.exists(temp_path): os.remove(temp_path)
-                            except Exception as inner_e:
-                                # Не друкуємо filename тут, щоб не викликати UnicodeEncodeError у терміналі
-                                print(f"❌ Не вдалося завантажити через temp: {str(inner_e).encode('ascii', 'ignore').decode('ascii')}")
-                                if os.path.exists(temp_path): os.remove(temp_path)
-                        
-            print(f"База знань готова! Активних документів: {len(knowledge_files_cache)}")
+                    try:
+                        # Використовуємо системне копіювання, яке краще справляється з шляхами
+                        shutil.copy2(file_path, temp_path)
+                        uploaded_file = ai_client.files.upload(file=temp_path, config={'display_name': safe_temp_name})
+                        active_files.append(uploaded_file)
+                        print(f"✅ Успішно завантажено (через temp): {safe_temp_name}")
+                        if os.path.exists(temp_path): os.remove(temp_path)
+                    except Exception as inner_e:
+                        # Не друкуємо filename тут, щоб не викликати UnicodeEncodeError у терміналі
+                        print(f"❌ Не вдалося завантажити через temp: {str(inner_e).encode('ascii', 'ignore').decode('ascii')}")
+                        if os.path.exists(temp_path): os.remove(temp_path)
+    return active_files
+
+async def sync_knowledge_base():
+    """Синхронізує базу знань один раз на всі воркери: решта беруть готовий список зі спільного стану."""
+    state_key = f"knowledge_files:{_knowledge_fingerprint()}"
+    while True:
+        records = shared_state.get_json(state_key)
+        if records is not None:
+            break
+        if shared_state.acquire_lease("knowledge_sync", ttl=KNOWLEDGE_SYNC_LEASE):
+            try:
+                records = shared_state.get_json(state_key)
+                if records is None:
+                    print("Синхронізація бази знань з Gemini...")
+                    files = await run_in_threadpool(_upload_knowledge_files)
+                    records = [{"uri": f.uri, "mime_type": f.mime_type} for f in files]
+                    shared_state.set_json(state_key, records, ttl=KNOWLEDGE_FILES_TTL)
+            finally:
+                shared_state.release_lease("knowledge_sync")
+            break
+        # Інший воркер уже синхронізує — чекаємо на його результат
+        await asyncio.sleep(2)
+
+    from google.genai import types
+    knowledge_files_cache[:] = [types.Part.from_uri(file_uri=r["uri"], mime_type=r["mime_type"]) for r in records]
+    print(f"База знань готова! Активних документів: {len(knowledge_files_cache)}")
+
+async def replica_sync_loop():
+    """Фонова синхронізація репліки: нові польоти кожні 30 с, повна звірка — раз на 10 хв.
+
+    Синхронізує один воркер на хост — з орендою ``REPLICA_SYNC_LEASE``; файл репліки
+    спільний для воркерів цього хоста.
+    """
+    last_full_sync = 0.0
+    while True:
+        if shared_state.acquire_lease(REPLICA_SYNC_LEASE, ttl=REPLICA_SYNC_INTERVAL * 3):
+            full = time.time() - last_full_sync >= REPLICA_FULL_SYNC_INTERVAL
+            try:
+                await run_in_threadpool(replica.sync, supabase, full)
+                if full:
+                    last_full_sync = time.time()
+                if replica.is_ready():
+                    startup_timer.mark("replica_ready")
+            except Exception as e:
+                print(f"⚠️ Синхронізація локальної репліки не вдалась (читання йде з останньої копії): {e}")
+        await asyncio.sleep(REPLICA_SYNC_INTERVAL)
+
+async def replica_event_loop():
+    while True:
+        event = await replica_events.get()
+        await run_in_threadpool(replica.apply_event, event)
+
+def load_all_flights():
+    if replica.is_ready():
+        return (json.loads(row) for page in replica.iter_flight_json_pages() for row in page)
+    return (f for page in iter_range_pages(fetch_flights_page) for f in page)
+
+async def search_index_loop():
+    """Пошуковий індекс: побудова після старту, далі перебудова раз на 10 хв — на випадок змін в обхід API."""
+    first_build = True
+    while True:
+        try:
+            if first_build:
+                with startup_timer.phase("search_index"):
+                    await flight_search.rebuild(load_all_flights)
+                first_build = False
+            else:
+                await flight_search.rebuild(load_all_flights)
         except Exception as e:
+            print(f"⚠️ Помилка побудови пошукового індексу: {e}")
+        await asyncio.sleep(SEARCH_REBUILD_INTERVAL)
+
+async def media_gc_loop():
+    """Прибирання блобів без посилань — раз на годину, в одному воркері хоста (оренда)."""
+    while True:
+        if shared_state.acquire_lease(MEDIA_GC_LEASE, ttl=MEDIA_GC_INTERVAL):
+            try:
+                stats = await run_in_threadpool(media.gc)
+                if stats["removed_blobs"] or stats["removed_strays"]:
+                    print(f"🧹 Медіа: видалено {stats['removed_blobs'] + stats['removed_strays']} файлів, {stats['freed_bytes'] // 1024} КБ")
+            except Exception as e:
+                print(f"⚠️ Помилка прибирання медіа: {e}")
+        await asyncio.sleep(MEDIA_GC_INTERVAL)
+
+@app.on_event("startup")
+async def startup_event():
+    # Тут лише запуск фонових задач: сторінки до кінця збірки статики віддаються з frontend/ як є
+    asyncio.create_task(build_static())
+    # Події з інших воркерів (спільний журнал) -> локальні SSE-підписники
+    asyncio.create_task(events.run_relay())
+    asyncio.create_task(replica_event_loop())
+    asyncio.create_task(media_gc_loop())
+    asyncio.create_task(warm_up())
+    startup_timer.mark("listening")
+
+async def build_static():
+    """Збірка статики в пулі потоків (готові файли з відбитком повторно не стискаються).
+
+    Щоб не стискати brotli на кожному старті, збирайте заздалегідь: ``python -m app.core.assets``.
+    """
+    try:
+        with startup_timer.phase("asset_build"):
+            await run_in_threadpool(asset_pipeline.build)
+    except Exception as e:
+        print(f"⚠️ Помилка збірки статики, сторінки віддаються як є: {e}")
+
+async def warm_up():
+    """Фоновий прогрів після того, як сервер почав приймати запити."""
+    await asyncio.sleep(0)
+    await supabase.warm()
+    if supabase or replica.is_ready():
+        asyncio.create_task(search_index_loop())
+    if supabase:
+        asyncio.create_task(replica_sync_loop())
+        # Очищення та нормалізація імен у базі.
+        # Оренду не звільняємо: воркери, що стартують у тому ж вікні, очищення не повторюють.
+        if shared_state.acquire_lease("db_cleanup", ttl=DB_CLEANUP_LEASE):
+            asyncio.create_task(cleanup_database_names())
+
+    # Синхронізація бази знань
+    if ai_client:
+        await ai_client.warm()
+        try:
+            with startup_timer.phase("knowledge_base"):
+                await sync_knowledge_base()
+            knowledge_state["warm"] = True
+        except Exception as e:
+            knowledge_state["error"] = str(e)
             print(f"⚠️ Загальна помилка ініціалізації бази знань: {e}")
     else:
         print("API ключ Gemini не знайдено. База знань не завантажена.")
 
-    # 2. Очищення та нормалізація імен у базі (Запуск у фоні, щоб не затримувати старт)
-    import asyncio
-    asyncio.create_task(cleanup_database_names())
+    print(f"⏱️ Запуск: {startup_timer.summary()}")
 
 # --- MODELS ---
 
@@ -230,6 +418,18 @@ class FlightResultUpdate(BaseModel):
     id: int
     result: str
 
+class FlightSelection(BaseModel):
+    """Набір польотів для масових операцій: явні ``ids`` або фільтр (хоча б одне поле)."""
+    ids: Optional[List[int]] = None
+    unit: Optional[str] = None
+    operator: Optional[str] = None
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    shift_time: Optional[str] = None
+
+class BulkFlightResultUpdate(FlightSelection):
+    result: str
+
 # --- HELPERS ---
 
 def calculate_duration(t1, t2):
@@ -250,6 +450,29 @@ def calculate_duration(t1, t2):
         print(f"Calc error: {e} for {t1}, {t2}")
         return 0
 
+def recalc_flight_metrics(flight: dict, result: str) -> dict:
+    """Нові наліт/дистанція/цикли АКБ для запису при зміні результату польоту."""
+    new_distance = flight.get("distance") or 0
+    new_cycles = flight.get("battery_cycles") or 0
+
+    if result == "Польоти не здійснювались":
+        new_duration = 0
+        new_distance = 0
+        new_cycles = 0
+    else:
+        # Перераховуємо наліт
+        new_duration = calculate_duration(flight.get("takeoff"), flight.get("landing"))
+        # Якщо дистанція 0, відновлюємо її приблизно (0.5 км / хв)
+        if new_distance == 0 and new_duration > 0:
+            new_distance = round(new_duration * 500, 1)
+
+    return {
+        "result": result,
+        "duration": float(new_duration),
+        "distance": float(new_distance),
+        "battery_cycles": float(new_cycles)
+    }
+
 def normalize_operator_name(name: str) -> str:
     """Нормалізує ім'я оператора: прибирає звання, ініціали та зайві знаки, залишаючи лише прізвище."""
     if not name: return "Невідомо"
@@ -287,13 +510,21 @@ def normalize_operator_name(name: str) -> str:
     
     return res_name or "Невідомо"
 
+def _row_unit(rows) -> Optional[str]:
+    """Підрозділ зміненого рядка (Supabase повертає змінені рядки) — для фільтрації подій."""
+    return rows[0].get("unit") if rows else None
+
 # --- API ROUTES ---
 
 @app.get("/api/get_announcement")
 async def get_announcement():
-    res = supabase.table("app_settings").select("*").eq("id", 1).execute()
-    if res.data:
-        return res.data[0]
+    if replica.is_ready():
+        settings = replica.get_settings(1)
+    else:
+        res = supabase.table("app_settings").select("*").eq("id", 1).execute()
+        settings = res.data[0] if res.data else None
+    if settings:
+        return settings
     return {"is_announcement_active": False, "announcement_text": ""}
 
 @app.post("/api/update_announcement")
@@ -303,6 +534,8 @@ async def update_announcement(data: AnnouncementUpdate):
             "announcement_text": data.text,
             "is_announcement_active": data.is_active
         }).eq("id", 1).execute()
+        replica.patch_settings(1, {"announcement_text": data.text, "is_announcement_active": data.is_active})
+        await events.publish("announcement", {"text": data.text, "is_active": data.is_active})
         return {"status": "ok"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -321,47 +554,172 @@ async def update_flight_result(data: FlightResultUpdate):
         flight = res_get.data[0]
         print(f"DEBUG: Current flight data: takeoff={flight.get('takeoff')}, landing={flight.get('landing')}, dur={flight.get('duration')}")
         
-        new_duration = flight.get("duration") or 0
-        new_distance = flight.get("distance") or 0
-        new_cycles = flight.get("battery_cycles") or 0
-        
         # 2. Логіка нальоту та ресурсів
-        if data.result == "Польоти не здійснювались":
-            new_duration = 0
-            new_distance = 0
-            new_cycles = 0
-            print("DEBUG: Setting all flight metrics to 0 (NoFly)")
-        else:
-            # Перераховуємо наліт
-            new_duration = calculate_duration(flight.get("takeoff"), flight.get("landing"))
-            
-            # Якщо дистанція 0, відновлюємо її приблизно (0.5 км / хв)
-            if new_distance == 0 and new_duration > 0:
-                new_distance = round(new_duration * 500, 1)
-                print(f"DEBUG: Restoring estimated distance: {new_distance}")
-            
-            print(f"DEBUG: Active flight recalced. Dur: {new_duration}, Dist: {new_distance}")
+        update_payload = recalc_flight_metrics(flight, data.result)
 
         # 3. Оновлюємо базу
-        update_payload = {
-            "result": data.result,
-            "duration": float(new_duration),
-            "distance": float(new_distance),
-            "battery_cycles": float(new_cycles)
-        }
         print(f"DEBUG: Updating with payload: {update_payload}")
         upd_res = supabase.table("flights").update(update_payload).eq("id", data.id).execute()
         
         print(f"DEBUG: Update result data: {upd_res.data}")
-        return {"status": "ok", "new_duration": float(new_duration), "new_distance": float(new_distance)}
+        replica.patch_flight(data.id, update_payload)
+        await events.publish("flight_updated", {"id": data.id, **update_payload}, unit=flight.get("unit"))
+        return {"status": "ok", "new_duration": update_payload["duration"], "new_distance": update_payload["distance"]}
     except Exception as e:
         print(f"CRITICAL API ERROR: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+BULK_CHUNK_SIZE = 500
+
+def _chunks(items: list, size: int = BULK_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def select_flights(sel: FlightSelection) -> list:
+    """Повні рядки польотів за вибіркою: за ``ids`` (шматками для ``in``) або за фільтром."""
+    def filtered(query):
+        if sel.unit:
+            query = query.eq("unit", sel.unit)
+        if sel.operator:
+            query = query.eq("operator", sel.operator)
+        if sel.date_from:
+            query = query.gte("date", sel.date_from)
+        if sel.date_to:
+            query = query.lte("date", sel.date_to)
+        if sel.shift_time:
+            query = query.eq("shift_time", sel.shift_time)
+        return query
+
+    if sel.ids:
+        ids = list(dict.fromkeys(sel.ids))
+        return [f for chunk in _chunks(ids)
+                for f in filtered(supabase.table("flights").select("*").in_("id", chunk)).execute().data or []]
+
+    def fetch_page(start: int, end: int) -> list:
+        return filtered(supabase.table("flights").select("*")).order("id").range(start, end).execute().data
+
+    return [f for page in iter_range_pages(fetch_page) for f in page]
+
+def _check_selection(sel: FlightSelection):
+    # Порожня вибірка означала б «усі польоти» — такого масові операції не роблять
+    if not sel.ids and not any([sel.unit, sel.operator, sel.date_from, sel.date_to, sel.shift_time]):
+        raise HTTPException(status_code=400, detail="Empty selection: pass ids or at least one filter")
+
+def _common_unit(flights: list) -> Optional[str]:
+    units = {f.get("unit") for f in flights}
+    return units.pop() if len(units) == 1 else None
+
+def apply_bulk_result(sel: BulkFlightResultUpdate) -> dict:
+    """Один запит на вибірку, перерахунок у пам'яті, по одному UPDATE ... IN (...) на групу однакових змін.
+
+    Саме UPDATE, а не upsert: видалений тим часом політ не повернеться неповним рядком.
+    Оновленими вважаються лише рядки, які повернула база.
+    """
+    flights = select_flights(sel)
+    changes = {f["id"]: recalc_flight_metrics(f, sel.result) for f in flights}
+
+    # Для «Польоти не здійснювались» група одна; інакше групуємо за однаковим нальотом/дистанцією
+    groups = {}
+    for flight_id, payload in changes.items():
+        groups.setdefault(tuple(sorted(payload.items())), []).append(flight_id)
+
+    updated, failed = [], []
+    for payload_key, ids in groups.items():
+        payload = dict(payload_key)
+        for chunk in _chunks(ids):
+            try:
+                res = supabase.table("flights").update(payload).in_("id", chunk).execute()
+                updated.extend(row["id"] for row in res.data or [])
+            except Exception as e:
+                print(f"Bulk update error ({len(chunk)} flights): {e}")
+                failed.extend(chunk)
+
+    done = set(updated)
+    replica.upsert_flights([{**f, **changes[f["id"]]} for f in flights if f["id"] in done])
+    requested = len(set(sel.ids)) if sel.ids else len(flights)
+    return {
+        "flights": flights,
+        "changes": {i: changes[i] for i in updated},
+        "report": {
+            "status": "ok" if not failed else "partial",
+            "requested": requested,
+            "matched": len(flights),
+            "updated": len(updated),
+            # Не знайдені при вибірці або видалені між вибіркою та оновленням
+            "not_found": sorted((set(sel.ids) if sel.ids else set(changes)) - done - set(failed)),
+            "failed": sorted(failed),
+            "flights": [{"id": i, "duration": changes[i]["duration"], "distance": changes[i]["distance"]} for i in updated],
+        },
+    }
+
+def apply_bulk_delete(sel: FlightSelection) -> dict:
+    flights = select_flights(sel)
+    ids = [f["id"] for f in flights]
+    deleted, failed = [], []
+    for chunk in _chunks(ids):
+        try:
+            supabase.table("flights").delete().in_("id", chunk).execute()
+            deleted.extend(chunk)
+        except Exception as e:
+            print(f"Bulk delete error ({len(chunk)} flights): {e}")
+            failed.extend(chunk)
+
+    replica.delete_flights(deleted)
+    requested = len(set(sel.ids)) if sel.ids else len(flights)
+    return {
+        "flights": flights,
+        "deleted": deleted,
+        "report": {
+            "status": "ok" if not failed else "partial",
+            "requested": requested,
+            "matched": len(flights),
+            "deleted": len(deleted),
+            "not_found": sorted(set(sel.ids) - set(ids)) if sel.ids else [],
+            "failed": sorted(failed),
+        },
+    }
+
+@app.post("/api/bulk_update_flight_result")
+async def bulk_update_flight_result(data: BulkFlightResultUpdate):
+    """Зміна результату для багатьох польотів одразу (за ids або фільтром) зі звітом по кожному."""
+    _check_selection(data)
+    try:
+        outcome = await run_in_threadpool(apply_bulk_result, data)
+    except Exception as e:
+        print(f"Bulk update error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    changes = outcome["changes"]
+    if changes:
+        # Одна подія на всю операцію, а не по одній на рядок
+        changed = [f for f in outcome["flights"] if f["id"] in changes]
+        await events.publish("flights_bulk_updated",
+                       {"ids": list(changes), "changes": {str(i): c for i, c in changes.items()}},
+                       unit=_common_unit(changed))
+    return outcome["report"]
+
+@app.post("/api/bulk_delete_flights")
+async def bulk_delete_flights(data: FlightSelection):
+    """Видалення багатьох польотів одразу (за ids або фільтром) зі звітом."""
+    _check_selection(data)
+    try:
+        outcome = await run_in_threadpool(apply_bulk_delete, data)
+    except Exception as e:
+        print(f"Bulk delete error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    deleted = set(outcome["deleted"])
+    if deleted:
+        await events.publish("flights_bulk_deleted", {"ids": outcome["deleted"]},
+                       unit=_common_unit([f for f in outcome["flights"] if f["id"] in deleted]))
+    return outcome["report"]
+
 @app.get("/api/get_unit_drones")
 async def get_unit_drones(unit: str = Query(...)):
+    if replica.is_ready():
+        return replica.get_drones(unit)
     res = supabase.table("drones").select("*").eq("unit", unit).execute()
     return res.data
 
@@ -369,6 +727,8 @@ async def get_unit_drones(unit: str = Query(...)):
 async def update_drone_status(data: StatusUpdate):
     try:
         res = supabase.table("drones").update({"status": data.status}).eq("id", data.id).execute()
+        replica.upsert_drones(res.data or [])
+        await events.publish("drone_updated", {"id": data.id, "status": data.status}, unit=_row_unit(res.data))
         return {"status": "ok"}
     except Exception as e:
         print(f"Error: {e}")
@@ -381,7 +741,9 @@ class BatteryUpdate(BaseModel):
 @app.post("/api/update_drone_battery")
 async def update_drone_battery(data: BatteryUpdate):
     try:
-        supabase.table("drones").update({"battery_count": data.battery_count}).eq("id", data.id).execute()
+        res = supabase.table("drones").update({"battery_count": data.battery_count}).eq("id", data.id).execute()
+        replica.upsert_drones(res.data or [])
+        await events.publish("drone_updated", {"id": data.id, "battery_count": data.battery_count}, unit=_row_unit(res.data))
         return {"status": "ok"}
     except Exception as e:
         print(f"Error updating battery count: {e}")
@@ -396,6 +758,9 @@ async def add_new_drone(data: dict):
             "serial_number": data['serial_number'],
             "status": "Active"
         }).execute()
+        replica.upsert_drones(res.data or [])
+        for drone in res.data or []:
+            await events.publish("drone_added", {"drone": drone}, unit=drone.get("unit"))
         return res.data
     except Exception as e:
         print(f"Error adding drone: {e}")
@@ -433,7 +798,9 @@ async def check_auth(data: AuthCheck):
 @app.delete("/api/delete_drone/{id}")
 async def delete_drone(id: int):
     try:
-        supabase.table("drones").delete().eq("id", id).execute()
+        res = supabase.table("drones").delete().eq("id", id).execute()
+        replica.delete_drones([id])
+        await events.publish("drone_deleted", {"id": id}, unit=_row_unit(res.data))
         return {"status": "ok"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -453,49 +820,104 @@ async def add_flight(entry: FlightEntry):
             data["duration"] = str(calculate_duration(entry.takeoff, entry.landing))
         if "id" in data: del data["id"]
         res = supabase.table("flights").insert(data).execute()
+        replica.upsert_flights(res.data or [])
+        for flight in res.data or []:
+            await events.publish("flight_added", {"flight": flight}, unit=flight.get("unit"))
         return {"status": "success", "data": res.data}
     except Exception as e:
         print(f"Database Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def store_uploads(files: List[UploadFile]) -> List[dict]:
+    """Зберігає завантаження в медіасховище шматками (у пулі потоків — запис на диск блокуючий)."""
+    stored = []
+    for f in files:
+        stored.append(await run_in_threadpool(media.put_stream, f.file))
+    return stored
+
+@app.post("/api/media")
+async def upload_media(files: List[UploadFile] = File(...)):
+    """Завантаження фото. Повертає id (sha256) — далі він іде в донесення замість самого файлу."""
+    try:
+        stored = await store_uploads(files)
+    except MediaTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except MediaError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    return [{**s, "url": f"/api/media/{s['id']}"} for s in stored]
+
+@app.get("/api/media/{media_id}")
+async def get_media(media_id: str, variant: Optional[str] = Query(None)):
+    info = media.info(media_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Media not found")
+    if variant and variant not in MEDIA_VARIANTS:
+        raise HTTPException(status_code=400, detail="Unknown variant")
+    if variant:
+        path = await run_in_threadpool(media.variant_path, media_id, variant)
+        media_type = "image/jpeg" if path != media.blob_path(media_id) else info["mime"]
+    else:
+        path, media_type = media.blob_path(media_id), info["mime"]
+    # Адреса = вміст: файл за нею ніколи не змінюється
+    return FileResponse(path, media_type=media_type, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
 @app.post("/api/publish_with_telegram")
-async def publish_report(report_text: str = Form(...), images: List[UploadFile] = File(None)):
+async def publish_report(
+    report_text: str = Form(...),
+    images: List[UploadFile] = File(None),
+    image_ids: List[str] = Form(None)
+):
+    """Донесення в Telegram. Фото — файлами (``images``) або id з ``/api/media`` (``image_ids``);
+    у будь-якому разі надсилається зменшений варіант з диска, а не оригінал з пам'яті."""
     try:
-        async with httpx.AsyncClient() as client:
-            if not images:
-                await client.post(
-                    f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage",
-                    data={"chat_id": TELEGRAM_CHAT_ID, "text": report_text, "parse_mode": "HTML"}
-                )
-            else:
-                media = []
-                files = {}
-                for i, img in enumerate(images):
-                    file_id = f"pic{i}"
-                    img_content = await img.read()
-                    files[file_id] = (img.filename, img_content)
-                    
-                    media_item = {
-                        "type": "photo",
-                        "media": f"attach://{file_id}"
-                    }
-                    # Додаємо підпис тільки до першого фото
-                    if i == 0:
-                        media_item["caption"] = report_text
-                        media_item["parse_mode"] = "HTML"
-                    media.append(media_item)
-                
-                # Відправка медіагрупи всередині контекстного менеджера
-                await client.post(
-                    f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMediaGroup",
-                    data={"chat_id": TELEGRAM_CHAT_ID, "media": json.dumps(media)},
-                    files=files
-                )
+        ids = [i for i in (image_ids or []) if media.exists(i)]
+        ids += [s["id"] for s in await store_uploads(images or [])]
+        paths = [await run_in_threadpool(media.variant_path, i, "telegram") for i in ids]
+
+        with ExitStack() as stack:
+            await send_telegram_report(report_text, [stack.enter_context(open(p, "rb")) for p in paths])
+        report_ref = f"report:telegram:{hashlib.sha256(report_text.encode('utf-8')).hexdigest()[:16]}"
+        for i in ids:
+            await run_in_threadpool(media.attach, i, report_ref)
         return {"status": "ok"}
     except Exception as e:
         print(f"Telegram API Error: {e}")
         return {"status": "error", "message": str(e)}
 
+async def send_telegram_report(report_text: str, photos: list):
+    import httpx
+    async with httpx.AsyncClient() as client:
+        if not photos:
+            await client.post(
+                f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage",
+                data={"chat_id": TELEGRAM_CHAT_ID, "text": report_text, "parse_mode": "HTML"}
+            )
+            return
+
+        media_group = []
+        files = {}
+        for i, photo in enumerate(photos):
+            file_id = f"pic{i}"
+            # Відкритий файл: httpx читає його шматками під час відправки
+            files[file_id] = (f"photo_{i}.jpg", photo, "image/jpeg")
+
+            media_item = {
+                "type": "photo",
+                "media": f"attach://{file_id}"
+            }
+            # Додаємо підпис тільки до першого фото
+            if i == 0:
+                media_item["caption"] = report_text
+                media_item["parse_mode"] = "HTML"
+            media_group.append(media_item)
+
+        # Відправка медіагрупи всередині контекстного менеджера
+        await client.post(
+            f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMediaGroup",
+            data={"chat_id": TELEGRAM_CHAT_ID, "media": json.dumps(media_group)},
+            files=files
+        )
+
 @app.get("/api/get_options")
 async def get_options():
     return {
@@ -505,25 +927,161 @@ async def get_options():
         "results": ["Без ознак порушення", "Затримання", "Польоти не здійснювались"]
     }
 
+def fetch_flights_page(start: int, end: int) -> list:
+    return supabase.table("flights").select("*").order("id", desc=True).range(start, end).execute().data
+
 @app.get("/api/get_all_flights")
 async def get_all_flights():
-    all_data = []
-    limit = 1000
-    start = 0
-    while True:
-        res = supabase.table("flights").select("*").order("id", desc=True).range(start, start + limit - 1).execute()
-        batch = res.data
-        if not batch: break
-        all_data.extend(batch)
-        if len(batch) < limit: break
-        start += limit
-    return all_data
+    # Віддаємо потоком: перший байт після першої сторінки, у пам'яті — одна сторінка
+    if replica.is_ready():
+        return StreamingResponse(encode_raw_json_array(replica.iter_flight_json_pages()), media_type="application/json")
+    return await stream_json_pages(fetch_flights_page)
+
+def _unit_query(query, unit: str):
+    """Фільтр за підрозділом, стійкий до пробілів по краях назви в базі (старий клієнт обрізав обидві сторони).
+
+    PostgREST не вміє порівнювати з TRIM, тож like звужує вибірку, а точний збіг — ``_same_unit``.
+    """
+    return query.like("unit", f"%{unit}%")
+
+def _same_unit(flight: dict, unit: str) -> bool:
+    return (flight.get("unit") or "").strip() == unit
+
+def load_unit_day_flights(unit: str, date: str) -> list:
+    if replica.is_ready():
+        return replica.get_flights(unit=unit, date=date)
+    rows = _unit_query(supabase.table("flights").select("*"), unit).eq("date", date).execute().data or []
+    return [f for f in rows if _same_unit(f, unit)]
+
+@app.get("/api/daily_report")
+async def daily_report(unit: str = Query(...), date: str = Query(...)):
+    """Готова структура добового донесення: оператор -> БпАК -> час вильотів, список БпАК, лічильники."""
+    unit = unit.strip()
+    flights = await run_in_threadpool(load_unit_day_flights, unit, date)
+    return assemble_daily_report(flights, unit, date)
+
+def load_mission_flights(unit: str, operator: Optional[str], before: Optional[tuple], limit: int) -> list:
+    if replica.is_ready():
+        return replica.get_mission_flights(unit, operator, before, limit)
+
+    def fetch_page(start: int, end: int) -> list:
+        query = _unit_query(supabase.table("flights").select("*"), unit)
+        if operator:
+            query = query.eq("operator", operator)
+        if before:
+            query = query.lte("date", before[0])
+        query = query.order("date", desc=True).order("shift_time", desc=True).order("id", desc=True)
+        return query.range(start, end).execute().data
+
+    flights, keys = [], set()
+    for page in iter_range_pages(fetch_page):
+        for f in page:
+            key = mission_key(f)
+            if not _same_unit(f, unit) or (before is not None and key >= before):
+                continue
+            flights.append(f)
+            keys.add(key)
+        last = page[-1]
+        if len(keys) <= limit or last.get("date") is None or last.get("shift_time") is None:
+            # NULL у Postgres при DESC іде першим — за таким рядком ще можуть бути новіші місії
+            continue
+        # Далі лише рядки зі старшими (date, shift_time): якщо вже й останній старший за
+        # limit + 1-шу місію, нових місій на сторінку та польотів до зібраних не буде
+        boundary = sorted(keys, reverse=True)[limit][:2]
+        if mission_key(last)[:2] < boundary:
+            break
+    return flights
+
+@app.get("/api/missions")
+async def get_missions(
+    unit: str = Query(...),
+    operator: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(DEFAULT_MISSIONS_LIMIT, ge=1, le=MAX_MISSIONS_LIMIT)
+):
+    """Журнал польотів, згрупований у місії (date + shift_time), новіші першими, сторінками за курсором."""
+    try:
+        before = decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    flights = await run_in_threadpool(load_mission_flights, unit.strip(), operator or None, before, limit)
+    return build_missions(flights, before, limit)
+
+@app.get("/api/replica_status")
+async def replica_status():
+    return replica.status()
+
+@app.get("/api/search_flights")
+async def search_flights(
+    q: str = Query(""),
+    unit: Optional[str] = Query(None),
+    date_from: Optional[str] = Query(None),
+    date_to: Optional[str] = Query(None),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT)
+):
+    """Пошук за маршрутом, оператором, БпАК, АКБ і результатом: префікси та одруківки, рейтинг, сторінки.
+
+    Широкий запит по всій історії — десятки мілісекунд CPU, тож у пулі потоків, а не в циклі подій.
+    """
+    if not flight_search.is_warm:
+        raise HTTPException(status_code=503, detail="Search index is warming up")
+    return await run_in_threadpool(
+        flight_search.search, q, unit=unit or None, date_from=date_from or None, date_to=date_to or None, offset=offset, limit=limit
+    )
+
+@app.get("/api/health/live")
+async def health_live():
+    """Процес живий і цикл подій відповідає — без походу в зовнішні сервіси."""
+    return {"status": "alive", "uptime_s": startup_timer.report()["uptime_s"]}
+
+@app.get("/api/health/ready")
+async def health_ready():
+    """Готовність приймати трафік: статика зібрана і дані доступні (клієнт БД або готова репліка).
+
+    ШІ та база знань — необов'язкові підсистеми: показуються, але готовність не блокують.
+    """
+    subsystems = {
+        "db": supabase.status(),
+        "replica": {"warm": replica.is_ready()},
+        "search": flight_search.status(),
+        "ai": ai_client.status(),
+        "knowledge_base": {
+            "configured": bool(ai_client),
+            "warm": knowledge_state["warm"],
+            "files": len(knowledge_files_cache),
+            "error": knowledge_state["error"],
+        },
+    }
+    ready = "listening" in startup_timer.marks and (supabase.is_warm or replica.is_ready())
+    return Response(
+        content=json.dumps({"ready": ready, "subsystems": subsystems}, ensure_ascii=False),
+        media_type="application/json",
+        status_code=200 if ready else 503
+    )
+
+@app.get("/api/health/startup")
+async def health_startup():
+    """Скільки забрала кожна фаза запуску (мс від початку імпорту main)."""
+    return startup_timer.report()
 
 @app.delete("/api/delete_flight/{id}")
 async def delete_flight(id: int):
-    supabase.table("flights").delete().eq("id", id).execute()
+    res = supabase.table("flights").delete().eq("id", id).execute()
+    replica.delete_flights([id])
+    await events.publish("flight_deleted", {"id": id}, unit=_row_unit(res.data))
     return {"status": "deleted"}
 
+@app.get("/api/events")
+async def live_events(request: Request, unit: Optional[str] = Query(None), last_event_id: Optional[str] = Query(None)):
+    """Потік змін (SSE). Відновлення — за заголовком Last-Event-ID, який EventSource шле сам."""
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    return StreamingResponse(
+        events.stream(unit or None, resume_from, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
     icon_path = os.path.join(FRONTEND_DIR, "icon.png")
@@ -533,35 +1091,45 @@ async def favicon():
 
 # --- PAGE ROUTES ---
 @app.get("/")
-async def read_index(): return FileResponse(os.path.join(FRONTEND_DIR, "index.html"))
+async def read_index(request: Request): return asset_pipeline.page_response(request, "index.html")
 @app.get("/dashboard")
-async def read_dashboard(): return FileResponse(os.path.join(FRONTEND_DIR, "dashboard.html"))
+async def read_dashboard(request: Request): return asset_pipeline.page_response(request, "dashboard.html")
 @app.get("/request")
-async def read_request(): return FileResponse(os.path.join(FRONTEND_DIR, "request.html"))
+async def read_request(request: Request): return asset_pipeline.page_response(request, "request.html")
 @app.get("/admin")
-async def read_admin(): return FileResponse(os.path.join(FRONTEND_DIR, "admin.html"))
+async def read_admin(request: Request): return asset_pipeline.page_response(request, "admin.html")
 @app.get("/analytics")
-async def read_analytics(): return FileResponse(os.path.join(FRONTEND_DIR, "analytics.html"))
+async def read_analytics(request: Request): return asset_pipeline.page_response(request, "analytics.html")
 @app.get("/report")
-async def read_report():
-    return FileResponse(
-        os.path.join(FRONTEND_DIR, "report.html"),
-        headers={
-            "Cache-Control": "no-cache, no-store, must-revalidate",
-            "Pragma": "no-cache",
-            "Expires": "0"
-        }
-    )
+async def read_report(request: Request): return asset_pipeline.page_response(request, "report.html")
 @app.get("/handbook")
-async def read_handbook(): return FileResponse(os.path.join(FRONTEND_DIR, "handbook.html"))
+async def read_handbook(request: Request): return asset_pipeline.page_response(request, "handbook.html")
 @app.get("/fleet")
-async def read_fleet(): return FileResponse(os.path.join(FRONTEND_DIR, "fleet_management.html"))
+async def read_fleet(request: Request): return asset_pipeline.page_response(request, "fleet_management.html")
 @app.get("/admin_analytics")
-async def read_admin_analytics(): return FileResponse(os.path.join(FRONTEND_DIR, "admin_analytics.html"))
+async def read_admin_analytics(request: Request): return asset_pipeline.page_response(request, "admin_analytics.html")
 @app.get("/support")
-async def read_support(): return FileResponse(os.path.join(FRONTEND_DIR, "support.html"))
+async def read_support(request: Request): return asset_pipeline.page_response(request, "support.html")
 @app.get("/xxx")
-async def read_xxx(): return FileResponse(os.path.join(FRONTEND_DIR, "xxx.html"))
+async def read_xxx(request: Request): return asset_pipeline.page_response(request, "xxx.html")
+
+# --- STATIC ASSETS ---
+@app.get("/assets/{path:path}", include_in_schema=False)
+async def read_asset(path: str, request: Request):
+    response = asset_pipeline.asset_response(request, path)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    return response
+
+@app.get("/sw.js", include_in_schema=False)
+async def read_service_worker(request: Request): return asset_pipeline.stable_response(request, "sw.js")
+@app.get("/manifest.json", include_in_schema=False)
+async def read_manifest(request: Request): return asset_pipeline.stable_response(request, "manifest.json")
+@app.get("/{page}.html", include_in_schema=False)
+async def read_html_page(page: str, request: Request):
+    if not asset_pipeline.has_page(f"{page}.html"):
+        raise HTTPException(status_code=404, detail="Page not found")
+    return asset_pipeline.page_response(request, f"{page}.html")
 
 # --- 9. API для ШІ-чату з Інтеграцією Google Maps та Weather API ---
 class ChatMessage(BaseModel):
@@ -569,6 +1137,7 @@ class ChatMessage(BaseModel):
 
 @app.post("/api/chat")
 async def chat_with_ai(message: str = Form(...), image: Optional[UploadFile] = File(None)):
+    import httpx
     user_msg = message.strip()
     
     # 1. Пошук координат у повідомленні (формат 48.4647, 35.0461)
@@ -664,7 +1233,13 @@ async def chat_with_ai(message: str = Form(...), image: Optional[UploadFile] = F
             if not ai_client:
                 yield "Дякую за запитання! Будь ласка, налаштуйте API-ключ Gemini у файлі .env."
                 return
+            # Клієнт (і google.genai) створюється в пулі потоків, а не в циклі подій
+            await ai_client.warm()
+            if not ai_client.is_warm:
+                yield "Сервіс ШІ ще запускається, спробуйте за хвилину."
+                return
 
+            from google.genai import types
             contents = []
             
             # 1. Додаємо всі PDF-мануали з бази знань
@@ -700,7 +1275,7 @@ async def chat_with_ai(message: str = Form(...), image: Optional[UploadFile] = F
                 # If the error is about documents with no pages, retry without knowledge files
                 if "no pages" in err_str.lower() or "не має сторінок" in err_str.lower() or "document" in err_str.lower():
                     print("⚠️ Помилка бази знань — спроба без документів...")
-                    safe_contents = [c for c in contents if not hasattr(c, 'uri')]
+                    safe_contents = [c for c in contents if getattr(c, 'file_data', None) is None]
                 else:
                     safe_contents = contents
                 # Fallback without grounding, using safe_contents (no bad docs)
@@ -723,19 +1298,34 @@ class DocxRequest(BaseModel):
     text: str
     filename: str
 
-# In-memory cache for generated DOCX files (cleared after download or timeout)
-_docx_cache: dict = {}
-
 @app.post("/api/generate_docx")
-async def generate_docx(report_data: str = Form(...), filename: str = Form(...)):
+async def generate_docx(
+    filename: str = Form(...),
+    report_data: str = Form("{}"),
+    unit: Optional[str] = Form(None),
+    date: Optional[str] = Form(None)
+):
+    """DOCX донесення. З ``unit`` + ``date`` (YYYY-MM-DD) польоти збирає сервер, у ``report_data`` — лише поля форми."""
     print(f"Generating DOCX: {filename}")
     try:
+        from docx import Document
+        from docx.shared import Pt, Cm
+        from docx.enum.text import WD_ALIGN_PARAGRAPH
+        from docx.oxml.ns import qn
+
         try:
             data = json.loads(report_data)
         except json.JSONDecodeError as je:
             print(f"JSON Decode Error: {je}")
             raise HTTPException(status_code=400, detail=f"Invalid JSON data: {str(je)}")
 
+        if unit and date:
+            report = assemble_daily_report(await run_in_threadpool(load_unit_day_flights, unit.strip(), date), unit.strip(), date)
+            data['flights'] = report['table']
+            data['drones_list'] = ", ".join(report['drones_list']) or "____"
+            data.setdefault('unit', report['unit'])
+            data.setdefault('date', ".".join(reversed(date.split("-"))))
+
         print(f"Report Data Keys: {list(data.keys())}")
         if 'flights' in data:
             print(f"Flights count: {len(data['flights'])}")
@@ -810,22 +1400,29 @@ async def generate_docx(report_data: str = Form(...), filename: str = Form(...))
         doc.add_paragraph(data.get('result', "Під час польотів порушень ОПДК не виявлено."))
 
         # 7. ФОТОФІКСАЦІЯ (ЯКЩО Є ФОТО)
+        # photo_ids — id з /api/media; photo (data:image base64) — старі клієнти та офлайн-черга
+        photo_ids = list(data.get('photo_ids') or [])
+        if data.get('photo_id'):
+            photo_ids.insert(0, data['photo_id'])
         photo_b64 = data.get('photo')
-        temp_photo_path = None
-        if photo_b64 and photo_b64.startswith('data:image'):
+        if not photo_ids and photo_b64 and photo_b64.startswith('data:image'):
             try:
                 import base64
                 header_data, encoded = photo_b64.split(",", 1)
-                photo_data = base64.b64decode(encoded)
-                temp_photo_path = os.path.join("app", f"{uuid.uuid4()}.jpg")
-                with open(temp_photo_path, "wb") as f:
-                    f.write(photo_data)
-                
+                stored = await run_in_threadpool(media.put_bytes, base64.b64decode(encoded))
+                photo_ids.append(stored["id"])
+            except Exception as e:
+                print(f"Помилка завантаження фото: {e}")
+
+        for photo_id in photo_ids:
+            try:
+                photo_path = await run_in_threadpool(media.variant_path, photo_id, "docx")
                 pic_para = doc.add_paragraph()
                 pic_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                pic_para.add_run().add_picture(temp_photo_path, width=Cm(15))
+                pic_para.add_run().add_picture(photo_path, width=Cm(15))
+                await run_in_threadpool(media.attach, photo_id, f"report:docx:{filename}")
             except Exception as e:
-                print(f"Помилка завантаження фото: {e}")
+                print(f"Помилка вставки фото {str(photo_id)[:12]}: {e}")
 
         # 8. ЗВ'ЯЗОК
         doc.add_paragraph("\nЗв'язок на кордоні підтримувався :")
@@ -870,28 +1467,9 @@ async def generate_docx(report_data: str = Form(...), filename: str = Form(...))
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/download_docx/{token}/{filename}")
-async def download_docx(token: str, filename: str):
-    entry = _docx_cache.get(token)
-    if not entry:
-        raise HTTPException(status_code=404, detail="File not found or expired")
-    data = entry['data']
-    # Remove from cache after serving
-    del _docx_cache[token]
-    from io import BytesIO
-    from urllib.parse import quote
-    
-    encoded_filename = quote(filename)
-    safe_ascii = "report.docx"
-    
-    return StreamingResponse(
-        BytesIO(data),
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        headers={"Content-Disposition": f"attachment; filename=\"{safe_ascii}\"; filename*=UTF-8''{encoded_filename}"}
-    )
-
 # Serving all static files from root for PWA compatibility
 app.mount("/", StaticFiles(directory=FRONTEND_DIR, html=True), name="static")
+startup_timer.lap("module_setup")
 
 if __name__ == "__main__":
     import uvicorn
@@ -106,6 +106,62 @@ const dbAPI = {
         });
     },
 
+    // Живі оновлення з сервера (SSE). EventSource сам перепідключається і шле Last-Event-ID.
+    subscribeLive(unit, onEvent, onResync) {
+        if (!window.EventSource) return null;
+        const url = unit ? `/api/events?unit=${encodeURIComponent(unit)}` : '/api/events';
+        const source = new EventSource(url);
+        source.onmessage = e => {
+            let event;
+            try { event = JSON.parse(e.data); } catch (err) { return; }
+            if (event.type === 'resync') {
+                if (onResync) onResync();
+                return;
+            }
+            onEvent(event);
+        };
+        return source;
+    },
+
+    applyFlightEvent(flights, event) {
+        if (event.type === 'flight_added') {
+            if (!flights.some(f => f.id === event.flight.id)) flights.unshift(event.flight);
+            return true;
+        }
+        if (event.type === 'flight_updated') {
+            const flight = flights.find(f => f.id == event.id);
+            if (!flight) return false;
+            ['result', 'duration', 'distance', 'battery_cycles'].forEach(k => {
+                if (k in event) flight[k] = event[k];
+            });
+            return true;
+        }
+        if (event.type === 'flight_deleted') {
+            const idx = flights.findIndex(f => f.id == event.id);
+            if (idx === -1) return false;
+            flights.splice(idx, 1);
+            return true;
+        }
+        if (event.type === 'flights_bulk_updated') {
+            let changed = false;
+            flights.forEach(f => {
+                const c = event.changes[String(f.id)];
+                if (c) { Object.assign(f, c); changed = true; }
+            });
+            return changed;
+        }
+        if (event.type === 'flights_bulk_deleted') {
+            const ids = new Set(event.ids.map(Number));
+            const before = flights.length;
+            for (let i = flights.length - 1; i >= 0; i--) {
+                if (ids.has(Number(flights[i].id))) flights.splice(i, 1);
+            }
+            return flights.length !== before;
+        }
+        return false;
+    },
+
+
     showNotification(msg, type = 'info') {
         const id = 'notification-' + Date.now();
         const div = document.createElement('div');
@@ -1,3 +1,4 @@
+// CACHE_NAME та ASSETS_TO_CACHE перезаписуються під час збірки статики (app/core/assets.py)
 const CACHE_NAME = 'uav-v8-cache-v11.0';
 const ASSETS_TO_CACHE = [
     '/',
@@ -24,7 +25,13 @@ const ASSETS_TO_CACHE = [
 self.addEventListener('install', event => {
     event.waitUntil(
         caches.open(CACHE_NAME).then(cache => {
-            return Promise.allSettled(ASSETS_TO_CACHE.map(url => cache.add(url)));
+            return Promise.allSettled(ASSETS_TO_CACHE.map(url => {
+                // URL з відбитком вмісту (/assets/...) незмінний — беремо з попереднього кешу без мережі
+                if (url.startsWith('/assets/')) {
+                    return caches.match(url).then(hit => hit ? cache.put(url, hit) : cache.add(url));
+                }
+                return cache.add(url);
+            }));
         })
     );
     self.skipWaiting();